@@ -1,22 +1,25 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import os
 import sys
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAIError
 
 ROOT = Path(__file__).resolve().parents[1]
 SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
-from rag_system.app.retrieval.reranker import rerank_with_scores
+from rag_system.app.retrieval.reranker import rerank_batch
 from rag_system.app.retrieval.faiss_store import get_store
-from rag_system.app.retrieval.embeddings import embed_texts
+from rag_system.app.retrieval.embeddings import embed_texts, l2_normalize
 from rag_system.app.response.context_builder import build_context
 
 
@@ -33,7 +36,7 @@ def load_cases(path: Path) -> List[EvalCase]:
     for line in path.read_text().splitlines():
         if not line.strip():
             continue
-        payload = json.loads(line)
+        payload = orjson.loads(line)
         cases.append(
             EvalCase(
                 query=payload["query"],
@@ -49,36 +52,32 @@ def chunk_id(chunk: Dict) -> str:
     return f"{chunk.get('source', 'unknown')}#{chunk.get('chunk_index', '0')}"
 
 
-def run_case(
-    store,
+@lru_cache(maxsize=1)
+def _llm() -> AsyncOpenAI:
+    # One client for the whole run so concurrent cases share a connection pool.
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise OpenAIError("OPENAI_API_KEY is not set.")
+    return AsyncOpenAI(api_key=api_key)
+
+
+async def _run_case(
     case: EvalCase,
-    k: int = 5,
+    reranked_with_scores: List[Tuple[Dict, float]],
+    sem: asyncio.Semaphore,
 ) -> Tuple[Dict, Dict]:
-    dense = store.search(
-        query_vector=embed_texts([case.query])[0],
-        k=k,
-        user_id=case.user_id,
-        doc_id=case.doc_id,
-    )
-    filtered = dense
-    reranked_with_scores = rerank_with_scores(case.query, filtered)
     reranked = [doc for doc, _ in reranked_with_scores]
     context_text, used_chunks = build_context(case.query, reranked)
 
-    import os
-
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise OpenAIError("OPENAI_API_KEY is not set.")
-    llm = OpenAI(api_key=api_key)
-    completion = llm.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "You are an enterprise RAG assistant."},
-            {"role": "user", "content": f"{context_text}\n\nQuestion: {case.query}"},
-        ],
-        max_tokens=300,
-    )
+    async with sem:
+        completion = await _llm().chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=[
+                {"role": "system", "content": "You are an enterprise RAG assistant."},
+                {"role": "user", "content": f"{context_text}\n\nQuestion: {case.query}"},
+            ],
+            max_tokens=300,
+        )
     answer = completion.choices[0].message.content or ""
 
     used_ids = [chunk_id(c) for c in used_chunks]
@@ -99,6 +98,38 @@ def run_case(
     return result, metrics
 
 
+async def _run_all(store, cases: List[EvalCase], k: int = 5) -> List[Tuple[Dict, Dict]]:
+    # Embedding, FAISS search and reranking are sync HTTP/CPU work; run them in
+    # worker threads so the event loop stays free for the completions.
+    query_embs = l2_normalize(
+        await asyncio.to_thread(embed_texts, [case.query for case in cases])
+    )
+    dense_per_case = await asyncio.gather(
+        *[
+            asyncio.to_thread(
+                store.search,
+                query_vector=query_emb,
+                k=k,
+                user_id=case.user_id,
+                doc_id=case.doc_id,
+            )
+            for case, query_emb in zip(cases, query_embs, strict=True)
+        ]
+    )
+    reranked_per_case = await asyncio.to_thread(
+        rerank_batch, query_embs, list(dense_per_case), k
+    )
+
+    sem = asyncio.Semaphore(int(os.getenv("EVAL_CONCURRENCY", "16")))
+    # gather preserves input order, so report rows line up with the cases file.
+    return await asyncio.gather(
+        *[
+            _run_case(case, reranked, sem)
+            for case, reranked in zip(cases, reranked_per_case, strict=True)
+        ]
+    )
+
+
 def main() -> None:
     load_dotenv(".env")
     cases = load_cases(Path("data/eval/queries.jsonl"))
@@ -107,13 +138,9 @@ def main() -> None:
         return
 
     store = get_store()
-    results = []
-    recalls = []
-
-    for case in cases:
-        result, metrics = run_case(store, case, k=5)
-        results.append(result)
-        recalls.append(metrics["recall"])
+    outcomes = asyncio.run(_run_all(store, cases, k=5))
+    results = [result for result, _ in outcomes]
+    recalls = [metrics["recall"] for _, metrics in outcomes]
 
     avg_recall = sum(recalls) / max(1, len(recalls))
     report = {
@@ -124,7 +151,9 @@ def main() -> None:
 
     out_dir = Path("reports")
     out_dir.mkdir(exist_ok=True)
-    (out_dir / "eval_report.json").write_text(json.dumps(report, indent=2))
+    (out_dir / "eval_report.json").write_bytes(
+        orjson.dumps(report, option=orjson.OPT_INDENT_2)
+    )
     (out_dir / "eval_report.md").write_text(
         f"# Offline Eval Report\n\n"
         f"- cases: {len(cases)}\n"
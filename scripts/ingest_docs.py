@@ -1,5 +1,8 @@
+import asyncio
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Tuple
 
 from dotenv import load_dotenv
 
@@ -11,31 +14,46 @@ if str(SRC) not in sys.path:
 load_dotenv()
 
 from rag_system.app.retrieval.chunking import chunk_text
-from rag_system.app.retrieval.embeddings import embed_texts
+from rag_system.app.retrieval.embeddings import embed_texts_batched, l2_normalize
 from rag_system.app.retrieval.faiss_store import get_store
+from rag_system.app.retrieval.schema import DocumentChunk
 
 
 def load_text(file_path: Path) -> str:
     return file_path.read_text(encoding="utf-8")
 
 
+def _chunk_one(file: Path) -> Tuple[Path, List[DocumentChunk]]:
+    text = load_text(file)
+    metadata = {
+        "source": file.name,
+        "user_id": "seed",
+        "doc_id": file.stem,
+    }
+    return file, chunk_text(text, metadata)
+
+
 def main() -> None:
     docs_path = Path("data/raw_docs")
+    files = sorted(docs_path.rglob("*.txt"))
+    if not files:
+        print(f"No .txt files found in {docs_path}")
+        return
+
+    # Chunking is CPU-bound, so fan files out across cores.
+    with ProcessPoolExecutor() as pool:
+        chunked = list(pool.map(_chunk_one, files))
+
+    chunks = [chunk for _, file_chunks in chunked for chunk in file_chunks]
+    embeddings = l2_normalize(
+        asyncio.run(embed_texts_batched([c.content for c in chunks]))
+    )
 
     store = get_store()
-    for file in docs_path.glob("*.txt"):
-        text = load_text(file)
-        metadata = {
-            "source": file.name,
-            "user_id": "seed",
-            "doc_id": file.stem,
-        }
-        chunks = chunk_text(text, metadata)
-        embeddings = embed_texts([c.content for c in chunks])
-
-        store.add_chunks([{"content": c.content, **c.metadata} for c in chunks], embeddings)
-
-        print(f"Ingested {file.name} ({len(chunks)} chunks)")
+    store.add_chunks([{"content": c.content, **c.metadata} for c in chunks], embeddings)
+
+    for file, file_chunks in chunked:
+        print(f"Ingested {file.name} ({len(file_chunks)} chunks)")
 
 
 if __name__ == "__main__":
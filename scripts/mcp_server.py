@@ -1,6 +1,8 @@
+import atexit
 import os
 import sys
-from typing import Any, Dict
+import time
+from typing import Any, Dict, List
 
 import httpx
 
@@ -18,6 +20,29 @@ API_QUERY_URL = f"{API_BASE_URL}/api/query"
 
 mcp = FastMCP("rag-system")
 
+# Shared across tool calls so repeated queries reuse kept-alive connections.
+_client = httpx.Client(
+    timeout=90,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
+)
+atexit.register(_client.close)
+
+
+def _wait_for_followups(
+    followups_id: str, attempts: int = 20, delay: float = 0.5
+) -> List[str]:
+    # /api/query returns before follow-ups exist; poll for them so MCP
+    # clients still get them in the tool result.
+    for _ in range(attempts):
+        resp = _client.get(f"{API_QUERY_URL}/followups/{followups_id}", timeout=10)
+        if resp.status_code != 200:
+            return []
+        data = resp.json()
+        if data.get("status") == "ready":
+            return data.get("follow_ups") or []
+        time.sleep(delay)
+    return []
+
 
 @mcp.tool()
 def rag_query(
@@ -44,10 +69,12 @@ def rag_query(
         "enable_followups": enable_followups,
         "enable_planning": enable_planning,
     }
-    with httpx.Client(timeout=90) as client:
-        resp = client.post(API_QUERY_URL, json=payload)
-        resp.raise_for_status()
-        return resp.json()
+    resp = _client.post(API_QUERY_URL, json=payload)
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("followups_id") and not data.get("follow_ups"):
+        data["follow_ups"] = _wait_for_followups(data["followups_id"])
+    return data
 
 
 if __name__ == "__main__":
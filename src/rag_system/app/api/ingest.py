@@ -1,6 +1,8 @@
+import asyncio
 import io
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
@@ -9,95 +11,137 @@ from pypdf import PdfReader
 
 from ..observability.ratelimit import rate_limiter
 from ..retrieval.chunking import chunk_text
-from ..retrieval.embeddings import embed_texts
+from ..retrieval.embeddings import embed_texts_batched, l2_normalize
 from ..retrieval.faiss_store import get_store
 
 router = APIRouter()
 
 
-@router.post("/ingest/file")
-async def ingest_file(
-    request: Request,
-    file: UploadFile = File(...),
-    doc_id: Optional[str] = Form(None),
-) -> dict:
-    filename = (file.filename or "").lower()
-    if not filename:
-        raise HTTPException(status_code=400, detail="Missing filename.")
+UPLOAD_READ_CHUNK = 1 << 20
 
-    browser_id = request.cookies.get("browser_id")
-    session_id = request.headers.get("x-session-id")
-    client_ip = request.headers.get("x-forwarded-for", request.client.host)
-    effective_user_id = browser_id or session_id or client_ip
-    rate_limiter.check("upload", effective_user_id, limit=1, window_seconds=3600)
 
-    data = await file.read()
-    max_mb = int(os.getenv("MAX_UPLOAD_MB", "10"))
+async def _read_upload(file: UploadFile, max_mb: int) -> bytes:
+    # Read in bounded chunks and stop as soon as the limit is crossed, so an
+    # oversized upload is rejected without being buffered in full.
     max_bytes = max_mb * 1024 * 1024
-    if len(data) > max_bytes:
+    buf = io.BytesIO()
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Max size is {max_mb} MB.",
+            )
+        buf.write(chunk)
+    return buf.getvalue()
+
+
+def _extract_pdf_text(data: bytes) -> str:
+    reader = PdfReader(io.BytesIO(data))
+    pages = [page.extract_text() or "" for page in reader.pages]
+    text = "\n\n".join(pages).strip()
+    if text:
+        return text
+
+    try:
+        from pdf2image import convert_from_bytes
+        import pytesseract
+    except Exception:
+        raise HTTPException(
+            status_code=400,
+            detail="No extractable text found. OCR dependencies not installed.",
+        )
+
+    workers = os.cpu_count() or 1
+    images = convert_from_bytes(data, thread_count=workers)
+    # Each image_to_string call runs the tesseract binary, so pages OCR in
+    # parallel across cores; map keeps page order.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ocr_pages = list(
+            pool.map(lambda img: pytesseract.image_to_string(img) or "", images)
+        )
+    text = "\n\n".join(ocr_pages).strip()
+    if not text:
         raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Max size is {max_mb} MB.",
+            status_code=400,
+            detail="No extractable text found (OCR failed).",
         )
-    text = ""
+    return text
+
 
+def _extract_text(filename: str, data: bytes) -> str:
+    # Parsing is blocking CPU work; callers run this in a worker thread.
     if filename.endswith(".pdf"):
-        reader = PdfReader(io.BytesIO(data))
-        pages = [page.extract_text() or "" for page in reader.pages]
-        text = "\n\n".join(pages).strip()
-        if not text:
-            try:
-                from pdf2image import convert_from_bytes
-                import pytesseract
-            except Exception:
-                raise HTTPException(
-                    status_code=400,
-                    detail="No extractable text found. OCR dependencies not installed.",
-                )
-
-            images = convert_from_bytes(data)
-            ocr_pages = [pytesseract.image_to_string(img) or "" for img in images]
-            text = "\n\n".join(ocr_pages).strip()
-            if not text:
-                raise HTTPException(
-                    status_code=400,
-                    detail="No extractable text found (OCR failed).",
-                )
-    elif filename.endswith(".docx"):
+        return _extract_pdf_text(data)
+    if filename.endswith(".docx"):
         try:
             import docx
         except Exception:
             raise HTTPException(status_code=400, detail="DOCX dependencies not installed.")
         doc = docx.Document(io.BytesIO(data))
-        text = "\n".join(p.text for p in doc.paragraphs).strip()
-    elif filename.endswith(".pptx"):
+        buf = io.StringIO()
+        for paragraph in doc.paragraphs:
+            buf.write(paragraph.text)
+            buf.write("\n")
+        return buf.getvalue().strip()
+    if filename.endswith(".pptx"):
         try:
             from pptx import Presentation
         except Exception:
             raise HTTPException(status_code=400, detail="PPTX dependencies not installed.")
         prs = Presentation(io.BytesIO(data))
-        parts = []
+        buf = io.StringIO()
         for slide in prs.slides:
             for shape in slide.shapes:
                 if hasattr(shape, "text") and shape.text:
-                    parts.append(shape.text)
-        text = "\n".join(parts).strip()
-    elif filename.endswith(".xlsx"):
+                    buf.write(shape.text)
+                    buf.write("\n")
+        return buf.getvalue().strip()
+    if filename.endswith(".xlsx"):
         try:
             from openpyxl import load_workbook
         except Exception:
             raise HTTPException(status_code=400, detail="XLSX dependencies not installed.")
-        wb = load_workbook(io.BytesIO(data), data_only=True)
-        rows = []
-        for ws in wb.worksheets:
-            for row in ws.iter_rows(values_only=True):
-                row_text = " | ".join("" if v is None else str(v) for v in row)
-                if row_text.strip():
-                    rows.append(row_text)
-        text = "\n".join(rows).strip()
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file type.")
+        # read_only streams sheet XML instead of building every cell in memory.
+        wb = load_workbook(io.BytesIO(data), data_only=True, read_only=True)
+        buf = io.StringIO()
+        try:
+            for ws in wb.worksheets:
+                for row in ws.iter_rows(values_only=True):
+                    row_text = " | ".join("" if v is None else str(v) for v in row)
+                    if row_text.strip():
+                        buf.write(row_text)
+                        buf.write("\n")
+        finally:
+            wb.close()
+        return buf.getvalue().strip()
+    raise HTTPException(status_code=400, detail="Unsupported file type.")
 
+
+@router.post("/ingest/file")
+async def ingest_file(
+    request: Request,
+    file: UploadFile = File(...),
+    doc_id: Optional[str] = Form(None),
+) -> dict:
+    filename = (file.filename or "").lower()
+    if not filename:
+        raise HTTPException(status_code=400, detail="Missing filename.")
+
+    browser_id = request.cookies.get("browser_id")
+    session_id = request.headers.get("x-session-id")
+    client_ip = request.headers.get("x-forwarded-for", request.client.host)
+    effective_user_id = browser_id or session_id or client_ip
+    rate_limiter.check("upload", effective_user_id, limit=1, window_seconds=3600)
+
+    max_mb = int(os.getenv("MAX_UPLOAD_MB", "10"))
+    data = await _read_upload(file, max_mb)
+
+    text = await asyncio.to_thread(_extract_text, filename, data)
     if not text:
         raise HTTPException(status_code=400, detail="No extractable text found.")
 
@@ -107,9 +151,11 @@ async def ingest_file(
         "doc_id": doc_id,
         "source": file.filename or "uploaded.pdf",
     }
-    chunks = chunk_text(text, metadata)
+    chunks = await asyncio.to_thread(chunk_text, text, metadata)
     try:
-        embeddings = embed_texts([c.content for c in chunks])
+        embeddings = l2_normalize(
+            await embed_texts_batched([c.content for c in chunks])
+        )
     except OpenAIError as exc:
         raise HTTPException(
             status_code=502,
@@ -118,7 +164,8 @@ async def ingest_file(
 
     try:
         store = get_store()
-        stored = store.add_chunks(
+        stored = await asyncio.to_thread(
+            store.add_chunks,
             [{"content": c.content, **c.metadata} for c in chunks],
             embeddings,
         )
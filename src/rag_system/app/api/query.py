@@ -1,11 +1,30 @@
+import asyncio
+import json
 import logging
 import os
 import time
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, suppress
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, Request
-from openai import OpenAI, OpenAIError
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from openai import AsyncOpenAI, OpenAIError
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 
 from ..generation.agentic import (
     generate_followups,
@@ -15,7 +34,7 @@ from ..generation.agentic import (
 )
 from ..retrieval.bm25_retriever import BM25Retriever
 from ..retrieval.faiss_store import get_store
-from ..retrieval.embeddings import embed_texts
+from ..retrieval.embeddings import embed_slots, embed_texts_coalesced
 from ..retrieval.reranker import rerank_with_scores
 from ..response.context_builder import build_context
 from ..observability.metrics import (
@@ -30,10 +49,30 @@ from ..observability.metrics import (
     USED_COUNT,
 )
 from ..observability.logging import trace_id_var
-from ..observability.ratelimit import rate_limiter
+from ..observability.ratelimit import get_redis_client, rate_limiter
 
 router = APIRouter()
 logger = logging.getLogger("rag")
+T = TypeVar("T")
+
+# Label children are bound once instead of resolved with .labels() per call.
+_LAT = {
+    stage: LATENCY_SECONDS.labels(stage=stage)
+    for stage in (
+        "planning",
+        "dense_retrieval",
+        "bm25_retrieval",
+        "reranking",
+        "context_building",
+        "generation",
+        "followups",
+    )
+}
+_REQUESTS = REQUESTS_TOTAL.labels(endpoint="/api/query")
+_ERRORS = ERRORS_TOTAL.labels(endpoint="/api/query")
+_TOKENS = {
+    kind: TOKENS_TOTAL.labels(type=kind) for kind in ("prompt", "completion", "total")
+}
 
 
 class QueryRequest(BaseModel):
@@ -48,6 +87,8 @@ class QueryRequest(BaseModel):
     enable_tools: Optional[bool] = None
     enable_followups: Optional[bool] = None
     enable_planning: Optional[bool] = None
+    # Server-sent events: meta, token..., then done (or error).
+    stream: bool = False
 
 
 class QueryResult(BaseModel):
@@ -67,15 +108,185 @@ class QueryResponse(BaseModel):
     tool_used: Optional[str] = None
     tool_output: Optional[str] = None
     follow_ups: List[str] = []
+    # Follow-ups are generated after the response is sent; poll
+    # /api/query/followups/{followups_id} for them.
+    followups_id: Optional[str] = None
     plan: Optional[Dict[str, Any]] = None
 
 
+class FollowupsResponse(BaseModel):
+    status: str
+    follow_ups: List[str] = []
+
+
+# Recent follow-up results by id (None while still being generated). Kept in
+# Redis when REDIS_URL is set so the poll can reach any worker; otherwise per
+# process and bounded, which only works with a single worker.
+FOLLOWUPS_MAX_ENTRIES = 1024
+FOLLOWUPS_TTL_SECONDS = 600
+
+
+class FollowupStore:
+    def __init__(self) -> None:
+        self._local: OrderedDict[str, Optional[List[str]]] = OrderedDict()
+        self._redis = get_redis_client()
+        if self._redis is None and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning(
+                "followups_per_process",
+                extra={"detail": "set REDIS_URL when running several workers"},
+            )
+
+    # Follow-ups are optional, so Redis errors are logged and treated as "no
+    # follow-ups" (None id, or unknown id) rather than failing the query.
+    async def reserve(self) -> Optional[str]:
+        followups_id = uuid4().hex
+        if self._redis is not None:
+            try:
+                await asyncio.to_thread(self._set, followups_id, None, False)
+            except Exception:
+                logger.warning("followups_unavailable", exc_info=True)
+                return None
+            return followups_id
+        self._local[followups_id] = None
+        while len(self._local) > FOLLOWUPS_MAX_ENTRIES:
+            self._local.popitem(last=False)
+        return followups_id
+
+    async def put(self, followups_id: str, follow_ups: List[str]) -> None:
+        if self._redis is not None:
+            # xx: an expired id stays unknown instead of being recreated.
+            try:
+                await asyncio.to_thread(self._set, followups_id, follow_ups, True)
+            except Exception:
+                logger.warning("followups_unavailable", exc_info=True)
+        elif followups_id in self._local:
+            self._local[followups_id] = follow_ups
+
+    def get(self, followups_id: str) -> Tuple[bool, Optional[List[str]]]:
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(f"followups:{followups_id}")
+            except Exception:
+                logger.warning("followups_unavailable", exc_info=True)
+                return False, None
+            return (False, None) if raw is None else (True, json.loads(raw))
+        if followups_id not in self._local:
+            return False, None
+        return True, self._local[followups_id]
+
+    def _set(self, followups_id: str, value: Any, xx: bool) -> None:
+        self._redis.set(
+            f"followups:{followups_id}",
+            json.dumps(value),
+            ex=FOLLOWUPS_TTL_SECONDS,
+            xx=xx,
+        )
+
+
+followup_store = FollowupStore()
+
+
+class _Timing:
+    ms: float = 0.0
+
+
+@contextmanager
+def _timed(stage: str) -> Iterator[_Timing]:
+    # Observes the stage histogram even when the block raises; .ms feeds spans.
+    timing = _Timing()
+    start = time.perf_counter_ns()
+    try:
+        yield timing
+    finally:
+        elapsed = time.perf_counter_ns() - start
+        timing.ms = elapsed / 1e6
+        _LAT[stage].observe(elapsed / 1e9)
+
+
+class _NullSpan:
+    # Stand-in when tracing is off, so stages can end spans unconditionally.
+    __slots__ = ()
+
+    def end(self, **kwargs: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _span(trace: Any, name: str, **kwargs: Any) -> Any:
+    return trace.span(name=name, **kwargs) if trace is not None else _NULL_SPAN
+
+
+def _openai_timeout() -> float:
+    return float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+
+
+async def _bounded(sem: Any, awaitable: Awaitable[T], stage: str) -> T:
+    # Caps in-flight OpenAI calls and bounds each one, so a stuck upstream
+    # call fails fast instead of pinning a worker.
+    timeout = _openai_timeout()
+    async with sem:
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "openai_timeout", extra={"stage": stage, "timeout_s": timeout}
+            )
+            raise
+
+
+async def _bounded_thread(
+    sem: asyncio.Semaphore,
+    stage: str,
+    func: Callable[..., T],
+    *args: Any,
+    **kwargs: Any,
+) -> T:
+    # _bounded for blocking calls. A timed-out thread keeps running, so its
+    # slot is only released once the thread has actually finished.
+    timeout = _openai_timeout()
+    await sem.acquire()
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    task.add_done_callback(lambda _: sem.release())
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "openai_timeout", extra={"stage": stage, "timeout_s": timeout}
+        )
+        raise
+
+
+async def _discard(task: asyncio.Task) -> None:
+    # Await the cancelled task so an exception it already finished with is
+    # retrieved instead of logged as "never retrieved".
+    task.cancel()
+    with suppress(BaseException):
+        await task
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/query/followups/{followups_id}", response_model=FollowupsResponse)
+def get_followups(followups_id: str) -> FollowupsResponse:
+    found, follow_ups = followup_store.get(followups_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Unknown or expired follow-ups id.")
+    if follow_ups is None:
+        return FollowupsResponse(status="pending")
+    return FollowupsResponse(status="ready", follow_ups=follow_ups)
+
+
 @router.post("/query", response_model=QueryResponse)
-def query_docs(
+async def query_docs(
     payload: QueryRequest,
     request: Request,
-) -> QueryResponse:
-    REQUESTS_TOTAL.labels(endpoint="/api/query").inc()
+    background_tasks: BackgroundTasks,
+) -> Union[QueryResponse, StreamingResponse]:
+    _REQUESTS.inc()
     browser_id = request.cookies.get("browser_id")
     session_id = request.headers.get("x-session-id")
     client_ip = request.headers.get("x-forwarded-for", request.client.host)
@@ -110,27 +321,25 @@ def query_docs(
         return raw.strip().lower() in {"1", "true", "yes", "on"}
 
     def chunk_id(chunk: Dict) -> str:
-        return f"{chunk.get('source', 'unknown')}#{chunk.get('chunk_index', '0')}"
-
-    # Query reception span
-    if trace is not None:
-        span = trace.span(
-            name="query_reception",
-            input={
-                "query": payload.query,
-                "user_id": user_context["user_id"],
-                "doc_id": payload.doc_id,
-            },
-        )
-        span.end(metadata={"latency_ms": 0})
+        # Dense results carry their key from dedup, so later stages (traces,
+        # citations) don't rebuild the string per lookup.
+        key = chunk.get("chunk_id")
+        if key is None:
+            key = f"{chunk.get('source', 'unknown')}#{chunk.get('chunk_index', '0')}"
+        return key
 
     try:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise OpenAIError(
-                "OPENAI_API_KEY is not set. Export it or set it in your .env file."
-            )
-        client = OpenAI(api_key=api_key)
+        # Shared pooled client from startup; build one only if it is missing.
+        client = getattr(request.app.state, "openai", None)
+        if client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise OpenAIError(
+                    "OPENAI_API_KEY is not set. Export it or set it in your .env file."
+                )
+            client = AsyncOpenAI(api_key=api_key)
+        # Shared caps on in-flight OpenAI calls across requests (set at startup).
+        llm_sem = getattr(request.app.state, "llm_sem", None) or nullcontext()
         enable_tools = (
             payload.enable_tools
             if payload.enable_tools is not None
@@ -151,7 +360,7 @@ def query_docs(
         try:
             store = get_store()
         except Exception as exc:
-            ERRORS_TOTAL.labels(endpoint="/api/query").inc()
+            _ERRORS.inc()
             raise HTTPException(
                 status_code=503, detail="Vector store is unavailable."
             ) from exc
@@ -159,14 +368,17 @@ def query_docs(
         plan = None
         planned_queries = [payload.query]
         if enable_planning:
-            planning_span = trace.span(name="planning") if trace else None
-            planning_start = time.perf_counter()
-            plan = plan_queries(client, payload.query, payload.doc_id)
-            planned_queries = plan.get("queries") or planned_queries
-            planning_latency = (time.perf_counter() - planning_start) * 1000
-            LATENCY_SECONDS.labels(stage="planning").observe(
-                planning_latency / 1000
-            )
+            planning_span = _span(trace, "planning")
+            with _timed("planning") as planning_timer:
+                try:
+                    plan = await _bounded(
+                        llm_sem,
+                        plan_queries(client, payload.query, payload.doc_id),
+                        "planning",
+                    )
+                except asyncio.TimeoutError:
+                    plan = None
+            planned_queries = (plan or {}).get("queries") or planned_queries
             logger.info(
                 "agentic_planning",
                 extra={
@@ -175,180 +387,170 @@ def query_docs(
                     "doc_id": payload.doc_id,
                 },
             )
-            if planning_span is not None:
-                planning_span.end(
-                    metadata={"latency_ms": round(planning_latency, 2)},
-                    output=plan,
-                )
+            planning_span.end(
+                metadata={"latency_ms": round(planning_timer.ms, 2)},
+                output=plan,
+            )
 
         # Dense retrieval
-        dense_span = (
-            trace.span(name="dense_retrieval", input={"k": payload.k})
-            if trace
-            else None
-        )
-        dense_start = time.perf_counter()
-        try:
-            query_vecs = embed_texts(planned_queries)
-        except OpenAIError as exc:
-            ERRORS_TOTAL.labels(endpoint="/api/query").inc()
-            raise HTTPException(
-                status_code=502,
-                detail="Embedding provider error. Check OPENAI_API_KEY.",
-            ) from exc
-
-        try:
+        dense_span = _span(trace, "dense_retrieval", input={"k": payload.k})
+        def dense_search() -> List[Dict]:
+            # All planned queries go to FAISS as one (nq, d) batch; repeats of
+            # the same index row are dropped inside the store.
+            merged = store.search_merged(
+                query_vecs,
+                k=payload.k,
+                user_id=user_context["user_id"],
+                doc_id=payload.doc_id,
+            )
+            # Distinct rows can still be the same chunk (a re-ingested file).
             dense_results = []
             seen_ids = set()
-            for vec in query_vecs:
-                results = store.search(
-                    query_vector=vec,
-                    k=payload.k,
-                    user_id=user_context["user_id"],
-                    doc_id=payload.doc_id,
-                )
-                for doc in results:
-                    doc_key = chunk_id(doc)
-                    if doc_key in seen_ids:
-                        continue
+            for doc in merged:
+                doc_key = chunk_id(doc)
+                if doc_key not in seen_ids:
                     seen_ids.add(doc_key)
+                    doc["chunk_id"] = doc_key
                     dense_results.append(doc)
-        except Exception as exc:
-            ERRORS_TOTAL.labels(endpoint="/api/query").inc()
-            raise HTTPException(
-                status_code=503, detail="Vector store is unavailable."
-            ) from exc
-        dense_latency = (time.perf_counter() - dense_start) * 1000
-        LATENCY_SECONDS.labels(stage="dense_retrieval").observe(dense_latency / 1000)
+            return dense_results
+
+        with _timed("dense_retrieval") as dense_timer:
+            try:
+                # Not bounded here: the coalescer takes embedding slots per
+                # outbound request, so waiting callers can still share one.
+                query_vecs = await _bounded(
+                    nullcontext(), embed_texts_coalesced(planned_queries), "embedding"
+                )
+            except asyncio.TimeoutError as exc:
+                _ERRORS.inc()
+                raise HTTPException(
+                    status_code=504, detail="Embedding provider timed out."
+                ) from exc
+            except OpenAIError as exc:
+                _ERRORS.inc()
+                raise HTTPException(
+                    status_code=502,
+                    detail="Embedding provider error. Check OPENAI_API_KEY.",
+                ) from exc
+
+            # FAISS, BM25 and reranking are blocking; keep them off the event loop.
+            try:
+                dense_results = await asyncio.to_thread(dense_search)
+            except Exception as exc:
+                _ERRORS.inc()
+                raise HTTPException(
+                    status_code=503, detail="Vector store is unavailable."
+                ) from exc
         dense_ids = [chunk_id(doc) for doc in dense_results]
         RETRIEVED_COUNT.observe(len(dense_results))
-        if dense_span is not None:
-            dense_span.end(
-                metadata={"latency_ms": round(dense_latency, 2)},
-                output={"chunk_ids": dense_ids},
-            )
+        dense_span.end(
+            metadata={"latency_ms": round(dense_timer.ms, 2)},
+            output={"chunk_ids": dense_ids},
+        )
 
         filtered_results = dense_results
 
-        # BM25 / sparse retrieval (over filtered dense results for now)
-        bm25_span = trace.span(name="bm25_retrieval") if trace else None
-        bm25_start = time.perf_counter()
-        if filtered_results:
-            bm25 = BM25Retriever([doc.get("content", "") for doc in filtered_results])
-            bm25_scores = bm25.get_top_n_with_scores(
-                payload.query, n=len(filtered_results)
-            )
-            bm25_ranked = [filtered_results[i] for i, _ in bm25_scores]
-            bm25_ranked_ids = [chunk_id(doc) for doc in bm25_ranked]
-            bm25_score_pairs = [
-                {"chunk_id": chunk_id(filtered_results[i]), "score": float(score)}
-                for i, score in bm25_scores
-            ]
-        else:
-            bm25_ranked = []
-            bm25_ranked_ids = []
-            bm25_score_pairs = []
-        bm25_latency = (time.perf_counter() - bm25_start) * 1000
-        LATENCY_SECONDS.labels(stage="bm25_retrieval").observe(bm25_latency / 1000)
-        if bm25_span is not None:
+        # BM25 only feeds the trace and reranking only needs the dense results,
+        # so the two stages run side by side.
+        async def bm25_stage() -> None:
+            bm25_span = _span(trace, "bm25_retrieval")
+            with _timed("bm25_retrieval") as bm25_timer:
+                if filtered_results:
+                    def bm25_rank() -> List[Tuple[int, float]]:
+                        bm25 = BM25Retriever(
+                            [doc.get("content", "") for doc in filtered_results]
+                        )
+                        # Only the top-k feed the trace, so let MaxScore prune the rest.
+                        return bm25.get_top_n_with_scores(payload.query, n=payload.k)
+
+                    bm25_scores = await asyncio.to_thread(bm25_rank)
+                    bm25_ranked_ids = [
+                        chunk_id(filtered_results[i]) for i, _ in bm25_scores
+                    ]
+                    bm25_score_pairs = [
+                        {
+                            "chunk_id": chunk_id(filtered_results[i]),
+                            "score": float(score),
+                        }
+                        for i, score in bm25_scores
+                    ]
+                else:
+                    bm25_ranked_ids = []
+                    bm25_score_pairs = []
             bm25_span.end(
-                metadata={"latency_ms": round(bm25_latency, 2)},
+                metadata={"latency_ms": round(bm25_timer.ms, 2)},
                 output={"chunk_ids": bm25_ranked_ids, "scores": bm25_score_pairs},
             )
 
-        # Reranking
-        rerank_span = trace.span(name="reranking") if trace else None
-        rerank_start = time.perf_counter()
-        if payload.rerank:
-            reranked_with_scores = rerank_with_scores(payload.query, filtered_results)
-            reranked = [doc for doc, _ in reranked_with_scores]
-            rerank_scores = [
-                {"chunk_id": chunk_id(doc), "score": float(score)}
-                for doc, score in reranked_with_scores
-            ]
-        else:
-            reranked = filtered_results
-            rerank_scores = []
-        rerank_latency = (time.perf_counter() - rerank_start) * 1000
-        LATENCY_SECONDS.labels(stage="reranking").observe(rerank_latency / 1000)
-        RERANKED_COUNT.observe(len(reranked))
-        if rerank_span is not None:
+        async def rerank_stage() -> List[Dict]:
+            rerank_span = _span(trace, "reranking")
+            with _timed("reranking") as rerank_timer:
+                if payload.rerank:
+                    # Every candidate is kept, not just the top k, so
+                    # build_context and the citations can fill the token
+                    # budget from all of them in reranked order.
+                    try:
+                        reranked_with_scores = await _bounded_thread(
+                            embed_slots(),
+                            "reranking",
+                            rerank_with_scores,
+                            payload.query,
+                            filtered_results,
+                        )
+                    except asyncio.TimeoutError:
+                        # Fall back to dense order rather than failing the query.
+                        reranked_with_scores = []
+                        reranked = filtered_results
+                    else:
+                        reranked = [doc for doc, _ in reranked_with_scores]
+                    rerank_scores = [
+                        {"chunk_id": chunk_id(doc), "score": float(score)}
+                        for doc, score in reranked_with_scores
+                    ]
+                else:
+                    reranked = filtered_results
+                    rerank_scores = []
+            RERANKED_COUNT.observe(len(reranked))
             rerank_span.end(
-                metadata={"latency_ms": round(rerank_latency, 2)},
+                metadata={"latency_ms": round(rerank_timer.ms, 2)},
                 output={"scores": rerank_scores},
             )
+            return reranked
+
+        _, reranked = await asyncio.gather(bm25_stage(), rerank_stage())
 
         # Context building
-        context_span = trace.span(name="context_building") if trace else None
-        context_start = time.perf_counter()
-        context_text, used_chunks = build_context(
-            payload.query, reranked, max_tokens=payload.max_context_tokens
-        )
-        context_latency = (time.perf_counter() - context_start) * 1000
-        LATENCY_SECONDS.labels(stage="context_building").observe(
-            context_latency / 1000
-        )
+        context_span = _span(trace, "context_building")
+        with _timed("context_building") as context_timer:
+            context_text, used_chunks = build_context(
+                payload.query, reranked, max_tokens=payload.max_context_tokens
+            )
         CONTEXT_LENGTH.observe(len(context_text))
         USED_COUNT.observe(len(used_chunks))
-        if context_span is not None:
-            context_span.end(
-                metadata={"latency_ms": round(context_latency, 2)},
-                output={"chunk_ids": [chunk_id(doc) for doc in used_chunks]},
-            )
+        context_span.end(
+            metadata={"latency_ms": round(context_timer.ms, 2)},
+            output={"chunk_ids": [chunk_id(doc) for doc in used_chunks]},
+        )
 
-        tool_used = None
-        tool_output = None
-        if enable_tools and context_text:
-            tool_used = select_tool(
-                client,
-                payload.query,
-                context_text,
-                enable_doc_actions=enable_doc_actions,
+        def answer_messages(
+            tool_used: Optional[str], tool_output: Optional[str]
+        ) -> List[Dict[str, str]]:
+            tool_block = (
+                f"\n\nTool output ({tool_used}):\n{tool_output}\n"
+                if tool_used and tool_output
+                else ""
             )
-            if tool_used == "none":
-                tool_used = None
-            if tool_used:
-                tool_output = run_tool(
-                    client,
-                    tool_used,
-                    payload.query,
-                    context_text,
-                    used_chunks,
-                )
-                logger.info(
-                    "agentic_tool_used",
-                    extra={
-                        "user_id": user_context["user_id"],
-                        "tool": tool_used,
-                        "doc_id": payload.doc_id,
-                        "output_chars": len(tool_output or ""),
-                    },
-                )
-
-        gen_span = trace.span(name="generation") if trace else None
-        gen_start = time.perf_counter()
-        tool_block = (
-            f"\n\nTool output ({tool_used}):\n{tool_output}\n"
-            if tool_used and tool_output
-            else ""
-        )
-        completion = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
+            return [
                 {"role": "system", "content": "You are an enterprise RAG assistant."},
                 {
                     "role": "user",
                     "content": f"{context_text}{tool_block}\n\nQuestion: {payload.query}",
                 },
-            ],
-            max_tokens=payload.max_answer_tokens,
-            temperature=payload.temperature,
-        )
-        answer = completion.choices[0].message.content or ""
-        gen_latency = (time.perf_counter() - gen_start) * 1000
-        LATENCY_SECONDS.labels(stage="generation").observe(gen_latency / 1000)
-        if gen_span is not None:
-            usage = getattr(completion, "usage", None)
+            ]
+
+        def end_generation_span(
+            gen_span: Any, gen_latency: float, usage: Any
+        ) -> None:
             gen_span.end(
                 metadata={
                     "latency_ms": round(gen_latency, 2),
@@ -363,50 +565,123 @@ def query_docs(
                     else None,
                 },
             )
-        usage = getattr(completion, "usage", None)
-        if usage:
-            if getattr(usage, "prompt_tokens", None) is not None:
-                TOKENS_TOTAL.labels(type="prompt").inc(int(usage.prompt_tokens))
-            if getattr(usage, "completion_tokens", None) is not None:
-                TOKENS_TOTAL.labels(type="completion").inc(
-                    int(usage.completion_tokens)
+
+        async def generate(
+            tool_used: Optional[str], tool_output: Optional[str]
+        ) -> Tuple[Any, float]:
+            gen_span = _span(trace, "generation")
+            gen_start = time.perf_counter()
+            try:
+                completion = await _bounded(
+                    llm_sem,
+                    client.chat.completions.create(
+                        model="gpt-4.1-mini",
+                        messages=answer_messages(tool_used, tool_output),
+                        max_tokens=payload.max_answer_tokens,
+                        temperature=payload.temperature,
+                    ),
+                    "generation",
                 )
-            if getattr(usage, "total_tokens", None) is not None:
-                TOKENS_TOTAL.labels(type="total").inc(int(usage.total_tokens))
-        QUERY_LENGTH.observe(len(payload.query))
-        logger.info(
-            "query_completed",
-            extra={
-                "user_id": user_context["user_id"],
-                "query_length": len(payload.query),
-                "retrieved": len(dense_results),
-                "reranked": len(reranked),
-                "used": len(used_chunks),
-                "prompt_tokens": getattr(usage, "prompt_tokens", None)
-                if usage
-                else None,
-                "completion_tokens": getattr(usage, "completion_tokens", None)
-                if usage
-                else None,
-                "total_tokens": getattr(usage, "total_tokens", None)
-                if usage
-                else None,
-            },
-        )
-        follow_ups: List[str] = []
-        if enable_followups:
-            followups_span = trace.span(name="followups") if trace else None
-            followups_start = time.perf_counter()
-            follow_ups = generate_followups(
-                client,
-                payload.query,
-                answer,
-                context_text,
+            except asyncio.TimeoutError as exc:
+                gen_span.end(metadata={"timed_out": True})
+                raise HTTPException(
+                    status_code=504, detail="Answer generation timed out."
+                ) from exc
+            except asyncio.CancelledError:
+                gen_span.end(metadata={"discarded": True})
+                raise
+            gen_latency = (time.perf_counter() - gen_start) * 1000
+            end_generation_span(gen_span, gen_latency, getattr(completion, "usage", None))
+            return completion, gen_latency
+
+        async def route_tool() -> Optional[str]:
+            try:
+                tool = await _bounded(
+                    llm_sem,
+                    select_tool(
+                        client,
+                        payload.query,
+                        context_text,
+                        enable_doc_actions=enable_doc_actions,
+                    ),
+                    "tool_selection",
+                )
+            except asyncio.TimeoutError:
+                return None
+            return None if tool == "none" else tool
+
+        async def apply_tool(tool: str) -> Optional[str]:
+            try:
+                output = await _bounded(
+                    llm_sem,
+                    run_tool(
+                        client,
+                        tool,
+                        payload.query,
+                        context_text,
+                        used_chunks,
+                    ),
+                    "tool",
+                )
+            except asyncio.TimeoutError:
+                return None
+            logger.info(
+                "agentic_tool_used",
+                extra={
+                    "user_id": user_context["user_id"],
+                    "tool": tool,
+                    "doc_id": payload.doc_id,
+                    "output_chars": len(output or ""),
+                },
             )
-            followups_latency = (time.perf_counter() - followups_start) * 1000
-            LATENCY_SECONDS.labels(stage="followups").observe(
-                followups_latency / 1000
+            return output
+
+        def record_completion(gen_latency: float, usage: Any) -> None:
+            _LAT["generation"].observe(gen_latency / 1000)
+            if usage:
+                if getattr(usage, "prompt_tokens", None) is not None:
+                    _TOKENS["prompt"].inc(int(usage.prompt_tokens))
+                if getattr(usage, "completion_tokens", None) is not None:
+                    _TOKENS["completion"].inc(int(usage.completion_tokens))
+                if getattr(usage, "total_tokens", None) is not None:
+                    _TOKENS["total"].inc(int(usage.total_tokens))
+            QUERY_LENGTH.observe(len(payload.query))
+            logger.info(
+                "query_completed",
+                extra={
+                    "user_id": user_context["user_id"],
+                    "query_length": len(payload.query),
+                    "retrieved": len(dense_results),
+                    "reranked": len(reranked),
+                    "used": len(used_chunks),
+                    "prompt_tokens": getattr(usage, "prompt_tokens", None)
+                    if usage
+                    else None,
+                    "completion_tokens": getattr(usage, "completion_tokens", None)
+                    if usage
+                    else None,
+                    "total_tokens": getattr(usage, "total_tokens", None)
+                    if usage
+                    else None,
+                },
             )
+
+        async def make_followups(answer: str) -> List[str]:
+            followups_span = _span(trace, "followups")
+            with _timed("followups") as followups_timer:
+                try:
+                    follow_ups = await _bounded(
+                        llm_sem,
+                        generate_followups(
+                            client,
+                            payload.query,
+                            answer,
+                            context_text,
+                        ),
+                        "followups",
+                    )
+                except asyncio.TimeoutError:
+                    follow_ups = []
             logger.info(
                 "agentic_followups",
                 extra={
@@ -415,50 +690,186 @@ def query_docs(
                     "count": len(follow_ups),
                 },
             )
-            if followups_span is not None:
-                followups_span.end(
-                    metadata={"latency_ms": round(followups_latency, 2)},
-                    output={"follow_ups": follow_ups},
+            followups_span.end(
+                metadata={"latency_ms": round(followups_timer.ms, 2)},
+                output={"follow_ups": follow_ups},
+            )
+            return follow_ups
+
+        async def deliver_followups(followups_id: str, answer: str) -> None:
+            try:
+                follow_ups = await make_followups(answer)
+            except Exception:
+                logger.exception("followups_failed")
+                follow_ups = []
+            await followup_store.put(followups_id, follow_ups)
+
+        def citation(chunk: Dict) -> Dict[str, Optional[str]]:
+            return {
+                "source": chunk.get("source"),
+                "chunk_index": str(chunk.get("chunk_index"))
+                if chunk.get("chunk_index") is not None
+                else None,
+            }
+
+        if payload.include_citations:
+            citations_used = [citation(chunk) for chunk in used_chunks]
+            used_keys = {chunk_id(chunk) for chunk in used_chunks}
+            citations_related = [
+                citation(chunk)
+                for chunk in reranked
+                if chunk_id(chunk) not in used_keys
+            ]
+        else:
+            citations_used = []
+            citations_related = []
+        citations = {"used": citations_used, "related": citations_related}
+
+        tool_used = None
+        tool_output = None
+        if payload.stream:
+            if enable_tools and context_text:
+                tool_used = await route_tool()
+                if tool_used:
+                    tool_output = await apply_tool(tool_used)
+            generated: Dict[str, Any] = {}
+            followups_id = await followup_store.reserve() if enable_followups else None
+            stream_trace_id = trace_id_var.get()
+
+            async def stream_events() -> AsyncIterator[str]:
+                yield _sse(
+                    "meta",
+                    {
+                        "query": payload.query,
+                        "context": context_text,
+                        "citations": citations,
+                        "results": [
+                            QueryResult(**result).model_dump()
+                            for result in filtered_results
+                        ],
+                        "tool_used": tool_used,
+                        "tool_output": tool_output,
+                        "followups_id": followups_id,
+                        "plan": plan,
+                    },
                 )
+                gen_span = _span(trace, "generation")
+                gen_start = time.perf_counter()
+                parts: List[str] = []
+                usage = None
+                try:
+                    # The slot is held until the last token has been relayed;
+                    # the timeout bounds the wait for the stream to open.
+                    async with llm_sem:
+                        stream = await asyncio.wait_for(
+                            client.chat.completions.create(
+                                model="gpt-4.1-mini",
+                                messages=answer_messages(tool_used, tool_output),
+                                max_tokens=payload.max_answer_tokens,
+                                temperature=payload.temperature,
+                                stream=True,
+                                stream_options={"include_usage": True},
+                            ),
+                            _openai_timeout(),
+                        )
+                        async for chunk in stream:
+                            usage = getattr(chunk, "usage", None) or usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                parts.append(delta)
+                                yield _sse("token", {"text": delta})
+                    answer = "".join(parts)
+                    generated["latency"] = (time.perf_counter() - gen_start) * 1000
+                    generated["usage"] = usage
+                    generated["answer"] = answer
+                    end_generation_span(gen_span, generated["latency"], usage)
+                    yield _sse("done", {"answer": answer})
+                except Exception:
+                    _ERRORS.inc()
+                    logger.exception("query_failed")
+                    yield _sse("error", {"detail": "Answer generation failed."})
+
+            async def stream_answer() -> AsyncIterator[str]:
+                # query_docs resets trace_id_var as soon as it returns the
+                # response, before Starlette iterates the stream; set it again
+                # so logs written while streaming keep the trace id.
+                token = trace_id_var.set(stream_trace_id)
+                try:
+                    async for event in stream_events():
+                        yield event
+                finally:
+                    trace_id_var.reset(token)
+
+            async def after_stream() -> None:
+                # Runs once the response has been sent in full.
+                token = trace_id_var.set(stream_trace_id)
+                try:
+                    if "latency" not in generated:
+                        if followups_id is not None:
+                            await followup_store.put(followups_id, [])
+                        return
+                    record_completion(generated["latency"], generated["usage"])
+                    if followups_id is not None:
+                        await deliver_followups(followups_id, generated["answer"])
+                finally:
+                    trace_id_var.reset(token)
+
+            return StreamingResponse(
+                stream_answer(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                background=BackgroundTask(after_stream),
+            )
+
+        if enable_tools and context_text:
+            # Most queries route to no tool, so start the plain answer while
+            # the router decides and only discard it when a tool is picked.
+            # Trade-off: a tool-routed query pays for one discarded completion
+            # (whatever it generated before the cancel) to save the router's
+            # latency on every other query.
+            speculative = asyncio.create_task(generate(None, None))
+            try:
+                tool_used = await route_tool()
+            except BaseException:
+                await _discard(speculative)
+                raise
+            if tool_used:
+                await _discard(speculative)
+                tool_output = await apply_tool(tool_used)
+                completion, gen_latency = await generate(tool_used, tool_output)
+            else:
+                completion, gen_latency = await speculative
+        else:
+            completion, gen_latency = await generate(None, None)
+
+        answer = completion.choices[0].message.content or ""
+        # Metrics and follow-ups run after the response has been sent.
+        background_tasks.add_task(
+            record_completion, gen_latency, getattr(completion, "usage", None)
+        )
+        followups_id = None
+        if enable_followups:
+            followups_id = await followup_store.reserve()
+            if followups_id is not None:
+                background_tasks.add_task(deliver_followups, followups_id, answer)
     except Exception:
-        ERRORS_TOTAL.labels(endpoint="/api/query").inc()
+        _ERRORS.inc()
         logger.exception("query_failed")
         raise
     finally:
         if trace_token is not None:
             trace_id_var.reset(trace_token)
 
-    if payload.include_citations:
-        citations_used = [
-            {
-                "source": chunk.get("source"),
-                "chunk_index": str(chunk.get("chunk_index"))
-                if chunk.get("chunk_index") is not None
-                else None,
-            }
-            for chunk in used_chunks
-        ]
-        citations_related = [
-            {
-                "source": chunk.get("source"),
-                "chunk_index": str(chunk.get("chunk_index"))
-                if chunk.get("chunk_index") is not None
-                else None,
-            }
-            for chunk in reranked
-            if chunk not in used_chunks
-        ]
-    else:
-        citations_used = []
-        citations_related = []
     return QueryResponse(
         query=payload.query,
         answer=answer,
         context=context_text,
-        citations={"used": citations_used, "related": citations_related},
+        citations=citations,
         results=[QueryResult(**result) for result in filtered_results],
         tool_used=tool_used,
         tool_output=tool_output,
-        follow_ups=follow_ups,
+        followups_id=followups_id,
         plan=plan,
     )
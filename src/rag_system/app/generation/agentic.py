@@ -1,8 +1,19 @@
+import asyncio
+import hashlib
 import json
+import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from ..observability.ratelimit import get_redis_client
+
+logger = logging.getLogger("rag")
 
 TOOL_NAMES = [
     "summarize",
@@ -22,6 +33,82 @@ DOC_ACTION_TOOLS = {
     "citations_by_section",
 }
 
+# "Term: definition" lines, matched across the whole context in one scan.
+# Line breaks are normalised to "\n" first (see _list_definitions).
+_DEF_RE = re.compile(
+    r"^[^\S\n]*([A-Za-z0-9][^:\n]{1,60}):[^\S\n]+([^\n]+)$",
+    re.MULTILINE,
+)
+
+
+# Routing decisions are cached per (query, allowed tools, context preview):
+# in process, and in Redis when REDIS_URL is set so every worker shares them.
+TOOL_CACHE_SIZE = 4096
+TOOL_CACHE_TTL_SECONDS = 24 * 3600
+_tool_cache: "OrderedDict[str, str]" = OrderedDict()
+# A failed Redis connection is retried after this long rather than for good.
+REDIS_RETRY_SECONDS = 30.0
+_redis_client = None
+_redis_retry_at = 0.0
+_redis_lock = threading.Lock()
+
+
+def _redis():
+    # Connects and pings, so it blocks: only call it from worker threads.
+    global _redis_client, _redis_retry_at
+    with _redis_lock:
+        if _redis_client is None and time.monotonic() >= _redis_retry_at:
+            _redis_client = get_redis_client()
+            if _redis_client is None:
+                _redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+        return _redis_client
+
+
+def _redis_call(method: str, *args: Any) -> Any:
+    client = _redis()
+    return None if client is None else getattr(client, method)(*args)
+
+
+def _tool_cache_key(query: str, allowed: List[str], preview: str) -> str:
+    raw = "\x00".join([query.strip().lower(), ",".join(allowed), preview])
+    return "toolroute:" + hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def _cached_tool(key: str) -> Optional[str]:
+    tool = _tool_cache.get(key)
+    if tool is not None:
+        _tool_cache.move_to_end(key)
+        return tool
+    if not os.getenv("REDIS_URL"):
+        return None
+    try:
+        tool = await asyncio.to_thread(_redis_call, "get", key)
+    except Exception:
+        logger.warning("tool_cache_unavailable", exc_info=True)
+        return None
+    if tool is not None:
+        _remember_tool_local(key, tool)
+    return tool
+
+
+def _remember_tool_local(key: str, tool: str) -> None:
+    _tool_cache[key] = tool
+    _tool_cache.move_to_end(key)
+    while len(_tool_cache) > TOOL_CACHE_SIZE:
+        _tool_cache.popitem(last=False)
+
+
+async def _remember_tool(key: str, tool: str) -> None:
+    _remember_tool_local(key, tool)
+    if not os.getenv("REDIS_URL"):
+        return
+    try:
+        await asyncio.to_thread(
+            _redis_call, "setex", key, TOOL_CACHE_TTL_SECONDS, tool
+        )
+    except Exception:
+        logger.warning("tool_cache_unavailable", exc_info=True)
+
 
 def _safe_json(content: str) -> Dict[str, Any]:
     try:
@@ -36,8 +123,8 @@ def _context_preview(text: str, limit: int = 1200) -> str:
     return text[:limit] + "\n...[truncated]"
 
 
-def select_tool(
-    client: OpenAI,
+async def select_tool(
+    client: AsyncOpenAI,
     query: str,
     context_text: str,
     enable_doc_actions: bool = True,
@@ -46,6 +133,12 @@ def select_tool(
     if not enable_doc_actions:
         allowed = [name for name in allowed if name not in DOC_ACTION_TOOLS]
 
+    preview = _context_preview(context_text)
+    cache_key = _tool_cache_key(query, allowed, preview)
+    cached = await _cached_tool(cache_key)
+    if cached in allowed:
+        return cached
+
     prompt = {
         "role": "user",
         "content": (
@@ -53,10 +146,10 @@ def select_tool(
             "Return JSON with keys: tool, reason. "
             f"Allowed tools: {', '.join(allowed)}.\n\n"
             f"Query: {query}\n\n"
-            f"Context (preview):\n{_context_preview(context_text)}"
+            f"Context (preview):\n{preview}"
         ),
     }
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[
             {"role": "system", "content": "You are a strict tool router."},
@@ -71,11 +164,13 @@ def select_tool(
     tool = data.get("tool", "none")
     if tool not in allowed:
         return "none"
+    # Only well-formed decisions are cached; a garbled reply is retried next time.
+    await _remember_tool(cache_key, tool)
     return tool
 
 
-def _run_llm_tool(
-    client: OpenAI,
+async def _run_llm_tool(
+    client: AsyncOpenAI,
     tool: str,
     query: str,
     context_text: str,
@@ -89,7 +184,7 @@ def _run_llm_tool(
         "draft_email": "Draft a professional email using the context. Cite sources if relevant.",
     }
     system = system_map.get(tool, "You are a helpful assistant.")
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[
             {"role": "system", "content": system},
@@ -124,13 +219,12 @@ def _find_tables(context_text: str) -> str:
 
 
 def _list_definitions(context_text: str) -> str:
-    results = []
-    for line in context_text.splitlines():
-        match = re.match(r"^\s*([A-Za-z0-9][^:]{1,60}):\s+(.+)$", line)
-        if match:
-            term = match.group(1).strip()
-            definition = match.group(2).strip()
-            results.append(f"- {term}: {definition}")
+    results = [
+        f"- {match.group(1).strip()}: {match.group(2).strip()}"
+        # splitlines() also breaks on \r, \f, \v, \x1c-\x1e, \x85, \u2028 and
+        # \u2029 (PDF text has form feeds); keep the same line boundaries.
+        for match in _DEF_RE.finditer("\n".join(context_text.splitlines()))
+    ]
     if not results:
         return "No definition-style lines found in the provided context."
     return "\n".join(results)
@@ -148,8 +242,8 @@ def _citations_by_section(used_chunks: List[Dict[str, Any]]) -> str:
     return "\n".join(entries)
 
 
-def run_tool(
-    client: OpenAI,
+async def run_tool(
+    client: AsyncOpenAI,
     tool: str,
     query: str,
     context_text: str,
@@ -162,15 +256,15 @@ def run_tool(
             return _list_definitions(context_text)
         if tool == "citations_by_section":
             return _citations_by_section(used_chunks or [])
-    return _run_llm_tool(client, tool, query, context_text)
+    return await _run_llm_tool(client, tool, query, context_text)
 
 
-def plan_queries(
-    client: OpenAI,
+async def plan_queries(
+    client: AsyncOpenAI,
     query: str,
     doc_id: Optional[str] = None,
 ) -> Dict[str, Any]:
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[
             {
@@ -204,13 +298,13 @@ def plan_queries(
     }
 
 
-def generate_followups(
-    client: OpenAI,
+async def generate_followups(
+    client: AsyncOpenAI,
     query: str,
     answer: str,
     context_text: str,
 ) -> List[str]:
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4.1-mini",
         messages=[
             {
@@ -1,5 +1,12 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import httpx
 from fastapi import FastAPI, Request, Response
 from dotenv import load_dotenv
+from openai import AsyncOpenAI
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from uuid import uuid4
 
@@ -8,6 +15,7 @@ from .api.query import router as query_router
 from .api.session import router as session_router
 from .observability.langfuse import configure_langfuse_logging, get_langfuse
 from .observability.logging import configure_json_logging, request_id_var
+from .response.context_builder import count_tokens
 from .retrieval.faiss_store import get_store
 
 load_dotenv(".env")
@@ -15,6 +23,31 @@ configure_langfuse_logging()
 configure_json_logging()
 
 app = FastAPI(title="RAG System")
+logger = logging.getLogger("rag")
+
+
+def _openai_client() -> Optional[AsyncOpenAI]:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        # /api/query reports the missing key per request.
+        return None
+    try:
+        import h2  # noqa: F401
+
+        http2 = True
+    except ImportError:
+        http2 = False
+    # One pooled client for the whole process keeps TCP/TLS connections to
+    # the API alive across requests.
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            http2=http2,
+        ),
+    )
+
 
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
@@ -48,13 +81,26 @@ async def ensure_browser_id(request: Request, call_next):
 def startup() -> None:
     app.state.store = get_store()
     app.state.langfuse = get_langfuse(raise_if_configured=True)
+    app.state.llm_sem = asyncio.Semaphore(
+        int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    )
+    app.state.openai = _openai_client()
+    try:
+        app.state.store.warmup()
+        # Loads the tokenizer used for context budgeting.
+        count_tokens("warmup")
+    except Exception:
+        logger.warning("startup_warmup_failed", exc_info=True)
 
 
 @app.on_event("shutdown")
-def shutdown() -> None:
+async def shutdown() -> None:
     store = getattr(app.state, "store", None)
     if store is not None:
         store.close()
+    openai_client = getattr(app.state, "openai", None)
+    if openai_client is not None:
+        await openai_client.close()
     langfuse = getattr(app.state, "langfuse", None)
     if langfuse is not None and hasattr(langfuse, "flush"):
         langfuse.flush()
@@ -1,51 +1,87 @@
-import json
+import atexit
+import copy
 import logging
+import queue
 import sys
 from contextvars import ContextVar
 from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
 
 request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
 trace_id_var: ContextVar[str | None] = ContextVar("trace_id", default=None)
 
 
+_SKIP = frozenset(
+    {
+        "name",
+        "msg",
+        "args",
+        "levelname",
+        "levelno",
+        "pathname",
+        "filename",
+        "module",
+        "exc_info",
+        "exc_text",
+        "stack_info",
+        "lineno",
+        "funcName",
+        "created",
+        "msecs",
+        "relativeCreated",
+        "thread",
+        "threadName",
+        "processName",
+        "process",
+        "request_id",
+        "trace_id",
+    }
+)
+
+
 class JsonFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
+        # The record's own creation time, not the time it was formatted.
+        created = datetime.fromtimestamp(record.created, timezone.utc)
         payload = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": created.isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
-            "request_id": request_id_var.get(),
-            "trace_id": trace_id_var.get(),
         }
+        # Queued records carry the ids captured on the logging thread.
+        request_id = getattr(record, "request_id", None) or request_id_var.get()
+        if request_id is not None:
+            payload["request_id"] = request_id
+        trace_id = getattr(record, "trace_id", None) or trace_id_var.get()
+        if trace_id is not None:
+            payload["trace_id"] = trace_id
         for key, value in record.__dict__.items():
-            if key in {
-                "name",
-                "msg",
-                "args",
-                "levelname",
-                "levelno",
-                "pathname",
-                "filename",
-                "module",
-                "exc_info",
-                "exc_text",
-                "stack_info",
-                "lineno",
-                "funcName",
-                "created",
-                "msecs",
-                "relativeCreated",
-                "thread",
-                "threadName",
-                "processName",
-                "process",
-            }:
-                continue
-            payload[key] = value
+            if key not in _SKIP:
+                payload[key] = value
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return orjson.dumps(payload, default=str).decode()
+
+
+class ContextQueueHandler(QueueHandler):
+    # Formatting happens on the listener thread, where the request's context
+    # variables are gone and args/tracebacks may have changed, so capture
+    # them here and leave the JSON encoding to the listener.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.request_id = request_id_var.get()
+        record.trace_id = trace_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def configure_json_logging() -> None:
@@ -53,6 +89,12 @@ def configure_json_logging() -> None:
     if root.handlers:
         return
     root.setLevel(logging.INFO)
+    # Request threads only enqueue; one listener thread formats and writes,
+    # so they never wait on the stream handler's lock.
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
     handler = logging.StreamHandler(sys.stdout)
     handler.setFormatter(JsonFormatter())
-    root.addHandler(handler)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(ContextQueueHandler(records))
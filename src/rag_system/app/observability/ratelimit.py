@@ -1,19 +1,39 @@
 import os
 import time
-from collections import defaultdict, deque
-from typing import Deque, Dict, Optional
+from collections import OrderedDict
+from typing import Tuple
 
 from fastapi import HTTPException, status
 
+MEMORY_MAX_KEYS = 100_000
 
-def _get_redis_client():
+# INCR and the first EXPIRE in one round-trip; a separate EXPIRE could be
+# lost between the two calls and leave the counter without a TTL.
+_INCR_WINDOW_LUA = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+
+def get_redis_client(decode_responses: bool = True):
     url = os.getenv("REDIS_URL")
     if not url:
         return None
     try:
         import redis
 
-        client = redis.Redis.from_url(url, decode_responses=True)
+        # Bounded so a down or unreachable Redis fails fast instead of hanging
+        # the caller.
+        timeout = float(os.getenv("REDIS_TIMEOUT_SECONDS", "1"))
+        client = redis.Redis.from_url(
+            url,
+            decode_responses=decode_responses,
+            socket_connect_timeout=timeout,
+            socket_timeout=timeout,
+        )
         client.ping()
         return client
     except Exception:
@@ -22,8 +42,17 @@ def _get_redis_client():
 
 class RateLimiter:
     def __init__(self) -> None:
-        self._events: Dict[str, Deque[float]] = defaultdict(deque)
-        self._redis = _get_redis_client()
+        # key -> (current window start, previous window count, current count),
+        # least recently used first so idle keys are evicted past the cap.
+        self._windows: OrderedDict[str, Tuple[float, int, int]] = OrderedDict()
+        # Only integer replies come back, so skip response decoding.
+        self._redis = get_redis_client(decode_responses=False)
+        # register_script sends EVALSHA and reloads the script on NOSCRIPT.
+        self._incr_window = (
+            self._redis.register_script(_INCR_WINDOW_LUA)
+            if self._redis is not None
+            else None
+        )
 
     def check(self, scope: str, key: str, *, limit: int, window_seconds: int) -> None:
         if self._redis is not None:
@@ -32,26 +61,37 @@ class RateLimiter:
         self._check_memory(scope, key, limit, window_seconds)
 
     def _check_memory(self, scope: str, key: str, limit: int, window_seconds: int) -> None:
-        now = time.time()
-        bucket = self._events[f"{scope}:{key}"]
-        cutoff = now - window_seconds
-        while bucket and bucket[0] < cutoff:
-            bucket.popleft()
-        if len(bucket) >= limit:
+        # Sliding-window counter: the previous window's count is weighted by
+        # how much of it still overlaps the last window_seconds. O(1) per
+        # check, and monotonic so wall-clock jumps don't reset limits.
+        now = time.monotonic()
+        name = f"{scope}:{key}"
+        start, previous, current = self._windows.get(name, (now, 0, 0))
+        elapsed = now - start
+        if elapsed >= window_seconds:
+            passed = int(elapsed // window_seconds)
+            previous = current if passed == 1 else 0
+            current = 0
+            start += passed * window_seconds
+            elapsed = now - start
+        estimate = previous * (1 - elapsed / window_seconds) + current
+        allowed = estimate < limit
+        self._windows[name] = (start, previous, current + 1 if allowed else current)
+        self._windows.move_to_end(name)
+        if len(self._windows) > MEMORY_MAX_KEYS:
+            self._windows.popitem(last=False)
+        if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail=f"Rate limit exceeded for {scope}. Try again later.",
             )
-        bucket.append(now)
 
     def _check_redis(self, scope: str, key: str, limit: int, window_seconds: int) -> None:
-        assert self._redis is not None
+        assert self._incr_window is not None
         now = int(time.time())
         bucket = now // window_seconds
         redis_key = f"ratelimit:{scope}:{key}:{bucket}"
-        count = self._redis.incr(redis_key)
-        if count == 1:
-            self._redis.expire(redis_key, window_seconds)
+        count = self._incr_window(keys=[redis_key], args=[window_seconds])
         if count > limit:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -1,19 +1,47 @@
+from functools import lru_cache
 from typing import Dict, List, Tuple
 
+ANSWER_MODEL = "gpt-4.1-mini"
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(ANSWER_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken missing or its BPE file could not be fetched (offline).
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder()
+    if encoder is None:
+        # Roughly four characters per token for English text.
+        return -(-len(text) // 4)
+    return len(encoder.encode(text))
+
 
 def build_context(
     query: str,
     reranked: List[Dict],
     max_tokens: int = 1500,
 ) -> Tuple[str, List[Dict]]:
-    content_accum = ""
+    parts: List[str] = []
+    running_tokens = 0
     used_chunks: List[Dict] = []
     for chunk in reranked:
         source = chunk.get("source", "unknown")
         chunk_index = chunk.get("chunk_index", "0")
         text = f"[{source}#{chunk_index}] {chunk.get('content', '')}\n"
-        if len(content_accum) + len(text) > max_tokens:
+        tokens = count_tokens(text)
+        if running_tokens + tokens > max_tokens:
             break
-        content_accum += text
+        parts.append(text)
+        running_tokens += tokens
         used_chunks.append(chunk)
-    return content_accum, used_chunks
+    return "".join(parts), used_chunks
@@ -1,23 +1,158 @@
-from typing import List, Tuple
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
-from rank_bm25 import BM25Okapi
+import numpy as np
 
 
 class BM25Retriever:
-    def __init__(self, docs: List[str]) -> None:
+    # Okapi BM25 (same scoring as rank_bm25.BM25Okapi, including its idf floor)
+    # over structure-of-arrays postings: per term, the ids of the documents
+    # containing it and the matching term frequencies. A query then costs a few
+    # vectorized NumPy ops instead of a Python loop over every doc.
+    def __init__(
+        self,
+        docs: List[str],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> None:
         self.docs = docs
-        tokenized = [doc.split() for doc in docs]
-        self.bm25 = BM25Okapi(tokenized)
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._last_query: Optional[Tuple[str, int]] = None
+        self._last_ranked: Optional[List[Tuple[int, float]]] = None
+        self.tokenized = [doc.split() for doc in docs]
+        self._build()
+
+    def _build(self) -> None:
+        n_docs = len(self.tokenized)
+        doc_len = np.array([len(tokens) for tokens in self.tokenized], dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs and doc_len.sum() else 1.0
+        # Length normalisation only depends on the document, so precompute it.
+        self._k_norm = (self.k1 * (1 - self.b + self.b * doc_len / avgdl)).astype(
+            np.float32
+        )
+
+        self.vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        for doc_idx, tokens in enumerate(self.tokenized):
+            for term, tf in Counter(tokens).items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc_idx)
+                tfs.append(tf)
+
+        # CSR layout: the postings of term t live in [offsets[t], offsets[t+1])
+        # of flat, contiguous int32/float32 arrays.
+        term_arr = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_arr, kind="stable")
+        df = np.bincount(term_arr, minlength=len(self.vocab))
+        self._offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self._post_docs = np.ascontiguousarray(
+            np.asarray(doc_ids, dtype=np.int32)[order]
+        )
+        self._post_tf = np.ascontiguousarray(np.asarray(tfs, dtype=np.float32)[order])
+        # The numerator tf*(k1+1) does not depend on the query either.
+        self._post_num = self._post_tf * np.float32(self.k1 + 1)
+
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        if idf.size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        self._idf = idf.astype(np.float32)
+
+        # MaxScore upper bound: the best contribution each term makes to any doc.
+        if df.size:
+            contrib = np.repeat(self._idf, df) * self._post_num
+            contrib /= self._post_tf + self._k_norm[self._post_docs]
+            self._max_score = np.maximum.reduceat(contrib, self._offsets[:-1])
+        else:
+            self._max_score = np.empty(0, dtype=np.float32)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        n_docs = len(self.docs)
+        term_ids = [self.vocab[t] for t in query.split() if t in self.vocab]
+        if not term_ids:
+            return np.zeros(n_docs, dtype=np.float32)
+        # Gather the postings of every query term into one flat run so the
+        # arithmetic is a single pass of packed float32 ops, then scatter-add
+        # per document. Repeated query terms count once per occurrence.
+        terms = np.asarray(term_ids, dtype=np.int64)
+        starts = self._offsets[terms]
+        lengths = self._offsets[terms + 1] - starts
+        run_starts = np.cumsum(lengths) - lengths
+        idx = np.repeat(starts - run_starts, lengths) + np.arange(lengths.sum())
+        docs = self._post_docs[idx]
+        contrib = self._post_tf[idx]
+        contrib += self._k_norm[docs]
+        np.divide(self._post_num[idx], contrib, out=contrib)
+        contrib *= np.repeat(self._idf[terms], lengths)
+        return np.bincount(docs, weights=contrib, minlength=n_docs).astype(np.float32)
+
+    def _term_contrib(
+        self, term_id: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self._offsets[term_id], self._offsets[term_id + 1]
+        docs = self._post_docs[lo:hi]
+        num = self._post_num[lo:hi]
+        tf = self._post_tf[lo:hi]
+        if mask is not None:
+            keep = mask[docs]
+            docs, num, tf = docs[keep], num[keep], tf[keep]
+        return docs, self._idf[term_id] * num / (tf + self._k_norm[docs])
+
+    def _rank(self, query: str, n: int) -> List[Tuple[int, float]]:
+        n_docs = len(self.docs)
+        term_ids = [self.vocab[t] for t in query.split() if t in self.vocab]
+        if (
+            n <= 0
+            or n >= n_docs
+            or len(term_ids) < 2
+            or (self._max_score[term_ids] < 0).any()
+        ):
+            scores = self.get_scores(query)
+            return [(int(i), float(scores[i])) for i in self._top_indices(scores, n)]
+
+        # MaxScore: add terms in decreasing order of their upper bound. Once
+        # the bounds of the terms left cannot lift any doc past the current
+        # n-th best score, only docs that can still reach it get the rest.
+        terms = sorted(term_ids, key=lambda t: -self._max_score[t])
+        remaining = np.cumsum(self._max_score[terms][::-1])[::-1].tolist() + [0.0]
+        scores = np.zeros(n_docs, dtype=np.float64)
+        candidates = None
+        for pos, term_id in enumerate(terms):
+            docs, contrib = self._term_contrib(term_id, candidates)
+            scores[docs] += contrib
+            if candidates is None:
+                threshold = np.partition(scores, n_docs - n)[n_docs - n]
+                if remaining[pos + 1] < threshold:
+                    candidates = scores + remaining[pos + 1] >= threshold
+        scores = scores.astype(np.float32)
+        return [(int(i), float(scores[i])) for i in self._top_indices(scores, n)]
+
+    def _ranked(self, query: str, n: int) -> List[Tuple[int, float]]:
+        # Callers often ask for ids and scores of the same query back to back.
+        key = (query, n)
+        if key != self._last_query or self._last_ranked is None:
+            self._last_ranked = self._rank(query, n)
+            self._last_query = key
+        return self._last_ranked
+
+    def _top_indices(self, scores: np.ndarray, n: int) -> np.ndarray:
+        if n <= 0 or scores.size == 0:
+            return np.empty(0, dtype=np.int64)
+        if n >= scores.size:
+            return np.argsort(-scores, kind="stable")
+        # Partial selection is O(D); only the n winners get fully sorted.
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.lexsort((top, -scores[top]))]
 
     def get_top_n(self, query: str, n: int = 5) -> List[int]:
-        scores = self.bm25.get_scores(query.split())
-        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-        return ranked[:n]
+        return [idx for idx, _ in self._ranked(query, n)]
 
     def get_top_n_with_scores(self, query: str, n: int = 5) -> List[Tuple[int, float]]:
-        scores = self.bm25.get_scores(query.split())
-        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-        return [(idx, scores[idx]) for idx in ranked[:n]]
+        return list(self._ranked(query, n))
 
     def get_top_n_docs(self, query: str, n: int = 5) -> List[str]:
         return [self.docs[idx] for idx in self.get_top_n(query, n=n)]
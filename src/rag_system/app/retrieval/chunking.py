@@ -1,20 +1,25 @@
+from functools import lru_cache
 from typing import List
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from .schema import DocumentChunk
 
 
+@lru_cache(maxsize=8)
+def _splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    # Splitters are stateless between calls, so build one per configuration.
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
 def chunk_text(
     text: str,
     metadata: dict,
     chunk_size: int = 800,
     chunk_overlap: int = 100,
 ) -> List[DocumentChunk]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-    )
-
-    chunks = splitter.split_text(text)
+    chunks = _splitter(chunk_size, chunk_overlap).split_text(text)
 
     return [
         DocumentChunk(
@@ -1,17 +1,340 @@
+import asyncio
+import hashlib
 import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
-from openai import OpenAI, OpenAIError
+import numpy as np
+from openai import AsyncOpenAI, OpenAI, OpenAIError
 
+EMBEDDING_MODEL = "text-embedding-3-small"
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+# The embeddings endpoint rejects requests with more inputs than this.
+MAX_INPUTS_PER_REQUEST = 2048
+
+
+class EmbeddingCache:
+    # Content-addressed store of embedding vectors, shared by ingest, eval and
+    # reranking so identical text is only ever sent to the provider once.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(text: str, model: str = EMBEDDING_MODEL) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode()).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(unique), 500):
+                batch = unique[start : start + 500]
+                placeholders = ",".join("?" for _ in batch)
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                # Full float32, so a cache hit returns exactly the vector the
+                # API did and scores do not depend on whether the cache was warm.
+                [
+                    (key, np.asarray(vec, dtype=np.float32).tobytes())
+                    for key, vec in items.items()
+                ],
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class MemoryEmbeddingCache:
+    # In-process LRU in front of the SQLite cache for hot texts such as
+    # repeated queries. Vectors live in one contiguous float32 block (grown by
+    # doubling up to capacity); evicted slots are reused.
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._free: List[int] = []
+        self._block: Optional[np.ndarray] = None
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None or key in found:
+                    continue
+                self._slots.move_to_end(key)
+                found[key] = self._block[slot].tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vec in items.items():
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._take_slot(len(vec))
+                    self._slots[key] = slot
+                else:
+                    self._slots.move_to_end(key)
+                self._block[slot] = vec
+
+    def _take_slot(self, dim: int) -> int:
+        if self._block is None or self._block.shape[1] != dim:
+            self._block = np.empty((min(1024, self.capacity), dim), dtype=np.float32)
+            self._slots.clear()
+            self._free = list(range(len(self._block) - 1, -1, -1))
+        if not self._free:
+            size = len(self._block)
+            if size < self.capacity:
+                grown = min(size * 2, self.capacity)
+                self._block = np.concatenate(
+                    [self._block, np.empty((grown - size, dim), dtype=np.float32)]
+                )
+                self._free = list(range(grown - 1, size - 1, -1))
+            else:
+                _, slot = self._slots.popitem(last=False)
+                return slot
+        return self._free.pop()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+_memory: Optional[MemoryEmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    path = os.getenv("RAG_EMBED_CACHE_PATH", "data/embed_cache.db")
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(path)
+    return _cache
+
+
+def get_memory_cache() -> Optional[MemoryEmbeddingCache]:
+    global _memory
+    capacity = int(os.getenv("RAG_EMBED_MEMORY_CACHE_SIZE", "10000"))
+    if capacity <= 0:
+        return None
+    with _cache_lock:
+        if _memory is None:
+            _memory = MemoryEmbeddingCache(capacity)
+    return _memory
+
+
+def _api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise OpenAIError(
             "OPENAI_API_KEY is not set. Export it or set it in your .env file."
         )
-    client = OpenAI(api_key=api_key)
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=texts,
-    )
-    return [item.embedding for item in response.data]
+    return api_key
+
+
+# Clients are built once per process so every call reuses the same HTTP
+# connection pool.
+@lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    return OpenAI(api_key=_api_key())
+
+
+@lru_cache(maxsize=1)
+def _async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=_api_key())
+
+
+_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+def embed_slots() -> asyncio.Semaphore:
+    # Process-wide cap on in-flight embedding requests (EMBED_MAX_CONCURRENCY),
+    # taken per outbound request so coalesced callers are not limited by it.
+    global _slots
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots[0] is not loop:
+        limit = int(os.getenv("EMBED_MAX_CONCURRENCY", "8"))
+        _slots = (loop, asyncio.Semaphore(limit))
+    return _slots[1]
+
+
+def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    client = _client()
+    embeddings: List[List[float]] = []
+    for start in range(0, len(texts), MAX_INPUTS_PER_REQUEST):
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts[start : start + MAX_INPUTS_PER_REQUEST],
+        )
+        embeddings.extend(item.embedding for item in response.data)
+    return embeddings
+
+
+def _lookup(
+    texts: Sequence[str],
+) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+    # Returns the cache key per input, cached vectors, and the unique texts
+    # (by key) that still need embedding.
+    keys = [EmbeddingCache.key(text) for text in texts]
+    memory = get_memory_cache()
+    found = memory.get_many(keys) if memory is not None else {}
+    cache = get_embedding_cache()
+    if cache is not None and len(found) < len(keys):
+        from_disk = cache.get_many([key for key in keys if key not in found])
+        if memory is not None:
+            memory.put_many(from_disk)
+        found.update(from_disk)
+    misses = {
+        key: text for key, text in zip(keys, texts, strict=True) if key not in found
+    }
+    return keys, found, misses
+
+
+def _remember(fresh: Dict[str, List[float]]) -> None:
+    memory = get_memory_cache()
+    if memory is not None:
+        memory.put_many(fresh)
+    cache = get_embedding_cache()
+    if cache is not None:
+        cache.put_many(fresh)
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    keys, found, misses = _lookup(texts)
+    if misses:
+        vectors = _request_embeddings(list(misses.values()))
+        fresh = dict(zip(misses, vectors, strict=True))
+        _remember(fresh)
+        found.update(fresh)
+    return [found[key] for key in keys]
+
+
+async def embed_texts_batched(
+    texts: list[str],
+    batch_size: int = 512,
+    concurrency: int = 8,
+) -> list[list[float]]:
+    # Large uploads are split into fixed-size requests sent in parallel, which
+    # keeps each request well under the provider's input/token caps.
+    keys, found, misses = await asyncio.to_thread(_lookup, texts)
+    if misses:
+        client = _async_client()
+        sem = asyncio.Semaphore(concurrency)
+        slots = embed_slots()
+        miss_texts = list(misses.values())
+
+        async def _embed_slice(batch: List[str]) -> List[List[float]]:
+            async with sem, slots:
+                response = await client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=batch,
+                )
+            return [item.embedding for item in response.data]
+
+        parts = await asyncio.gather(
+            *[
+                _embed_slice(miss_texts[start : start + batch_size])
+                for start in range(0, len(miss_texts), batch_size)
+            ]
+        )
+        fresh = dict(zip(misses, chain.from_iterable(parts), strict=True))
+        await asyncio.to_thread(_remember, fresh)
+        found.update(fresh)
+    return [found[key] for key in keys]
+
+
+class _EmbedBatcher:
+    # Coalesces concurrent single-request embedding calls: texts queue up for
+    # at most max_wait_ms (or until max_batch are waiting) and go out together.
+    def __init__(self, max_batch: int = 512, max_wait_ms: float = 10.0) -> None:
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[Tuple[str, asyncio.Future]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # The loop only holds weak references to tasks; in-flight flushes are
+        # kept here so they cannot be collected with callers still waiting.
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+        futures = []
+        for text in texts:
+            future = self.loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Flush in the background so the next batch starts collecting now.
+            flush = self.loop.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            vectors = await embed_texts_batched([text for text, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), vector in zip(batch, vectors, strict=True):
+            if not future.done():
+                future.set_result(vector)
+
+
+_batcher: Optional[_EmbedBatcher] = None
+
+
+async def embed_texts_coalesced(texts: list[str]) -> list[list[float]]:
+    global _batcher
+    if _batcher is None or _batcher.loop is not asyncio.get_running_loop():
+        _batcher = _EmbedBatcher()
+    return await _batcher.embed(texts)
+
+
+def l2_normalize(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    # Unit-length rows turn cosine similarity into a plain dot product.
+    arr = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
@@ -1,30 +1,177 @@
+import atexit
+import math
 import os
 import sqlite3
 import threading
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import faiss  # type: ignore
 import numpy as np
 
 
+def _set_faiss_threads() -> None:
+    # Flat inner-product search stops scaling past a handful of threads and
+    # oversubscribes the worker pool beyond that.
+    threads = int(os.getenv("RAG_FAISS_THREADS", "0")) or min(os.cpu_count() or 1, 8)
+    faiss.omp_set_num_threads(threads)
+
+
+def _index_type() -> str:
+    return os.getenv("RAG_INDEX_TYPE", "flat").lower()
+
+
+_IVF_TYPES = ("ivf", "ivfpq")
+
+
+def _pq_m(dim: int) -> int:
+    # PQ sub-vectors must divide the dimension; step down to the nearest one.
+    m = max(1, min(int(os.getenv("RAG_PQ_M", "64")), dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _ivf_min_vectors() -> int:
+    # Below this an IVF index cannot be trained well (faiss wants ~39 points
+    # per list with nlist = 4*sqrt(N)) and brute force is cheap anyway.
+    return int(os.getenv("RAG_IVF_MIN_VECTORS", "25000"))
+
+
+def _new_index(dim: int, train: Optional[np.ndarray] = None) -> faiss.Index:
+    # RAG_INDEX_TYPE=fp16 keeps vectors as half floats: half the RAM and
+    # memory bandwidth per search, with negligible recall loss on unit vectors.
+    # RAG_INDEX_TYPE=ivf clusters the corpus and only scans nprobe lists per
+    # query; it needs training vectors, so small corpora stay flat.
+    # RAG_INDEX_TYPE=ivfpq also product-quantizes each vector to RAG_PQ_M
+    # bytes, for corpora that no longer fit in RAM as float32.
+    index_type = _index_type()
+    if (
+        index_type in _IVF_TYPES
+        and train is not None
+        and len(train) >= _ivf_min_vectors()
+    ):
+        nlist = max(1, int(4 * math.sqrt(len(train))))
+        codec = f"PQ{_pq_m(dim)}x8" if index_type == "ivfpq" else "Flat"
+        base = faiss.index_factory(
+            dim, f"IVF{nlist},{codec}", faiss.METRIC_INNER_PRODUCT
+        )
+        if index_type == "ivfpq":
+            # The factory turns on polysemous training, which only pays off
+            # with Hamming-threshold search and dominates the training time.
+            base.do_polysemous_training = False
+        base.train(train)
+    elif index_type == "fp16":
+        base = faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+    else:
+        base = faiss.IndexFlatIP(dim)
+    return _tune(faiss.IndexIDMap2(base))
+
+
+def _tune(index: faiss.Index) -> faiss.Index:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = int(os.getenv("RAG_IVF_NPROBE", "16"))
+    return index
+
+
+def _needs_rebuild(index: faiss.Index, ntotal: int) -> bool:
+    # A flat index started on a small corpus is swapped for IVF once the
+    # corpus is large enough to train one.
+    return (
+        _index_type() in _IVF_TYPES
+        and faiss.try_extract_index_ivf(index) is None
+        and ntotal >= _ivf_min_vectors()
+    )
+
+
+FILTER_CACHE_SIZE = 256
+
+_ROWS_BY_ID_SQL = """
+SELECT id, user_id, doc_id, source, chunk_index, content
+FROM chunks WHERE id IN (SELECT value FROM json_each(?))
+"""
+
+
+class _SearchJob:
+    __slots__ = ("queries", "k", "selector", "ids", "error")
+
+    def __init__(
+        self, queries: np.ndarray, k: int, selector: Optional[faiss.IDSelector]
+    ) -> None:
+        self.queries = queries
+        self.k = k
+        self.selector = selector
+        self.ids: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
 class FaissStore:
-    def __init__(self, db_path: str, index_path: str) -> None:
+    def __init__(
+        self, db_path: str, index_path: str, embeddings_path: Optional[str] = None
+    ) -> None:
         self.db_path = db_path
         self.index_path = index_path
+        # All vectors live in one flat float32 file; chunks rows point into it
+        # by row_offset, so rebuilding the index maps the file instead of
+        # decoding a BLOB per row.
+        self.embeddings_path = embeddings_path or os.path.join(
+            os.path.dirname(index_path), "embeddings.f32"
+        )
         self._lock = threading.Lock()
+        # Serialises ingest on the shared connection so the id range below
+        # cannot interleave with another thread's batch; held until the rows
+        # are in the index so _sync never replays them a second time.
+        self._write_lock = threading.Lock()
+        # (user_id, doc_id) -> (FAISS id selector, match count); dropped on
+        # ingest, and the epoch stops a lookup that raced an ingest from
+        # caching a stale selector.
+        self._filters: OrderedDict = OrderedDict()
+        self._filter_epoch = 0
+        self._pending: List[_SearchJob] = []
+        self._pending_lock = threading.Lock()
+        _set_faiss_threads()
         self._ensure_dirs()
-        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Autocommit; add_chunks opens its own write transaction.
+        self._conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None
+        )
         self._conn.row_factory = sqlite3.Row
+        self._configure()
         self._ensure_schema()
+        self._migrate_blobs()
+        # Vectors added since the index file was last written.
+        self._unflushed = 0
+        self._mmapped = False
+        self._flush_every = int(os.getenv("RAG_INDEX_FLUSH_EVERY", "1000"))
+        # OpenAI embeddings are already unit length, so query vectors can skip
+        # the extra normalisation pass; stored vectors are always normalised.
+        flag = os.getenv("RAG_ASSUME_NORMALIZED", "")
+        self._assume_normalized = flag.strip().lower() in {"1", "true", "yes", "on"}
         self._index = self._load_or_build_index()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
 
     def _ensure_dirs(self) -> None:
-        db_dir = os.path.dirname(self.db_path)
-        idx_dir = os.path.dirname(self.index_path)
-        if db_dir:
-            os.makedirs(db_dir, exist_ok=True)
-        if idx_dir:
-            os.makedirs(idx_dir, exist_ok=True)
+        for path in (self.db_path, self.index_path, self.embeddings_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _configure(self) -> None:
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        if self.db_path == ":memory:":
+            return
+        # WAL lets other processes (worker or ingest script) read while one
+        # writes; this process shares one connection, so it gets no separate
+        # snapshot. NORMAL only fsyncs at checkpoints, still crash-safe in WAL.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        self._conn.execute("PRAGMA cache_size=-65536")
 
     def _ensure_schema(self) -> None:
         self._conn.execute(
@@ -36,77 +183,251 @@ class FaissStore:
                 source TEXT,
                 chunk_index INTEGER,
                 content TEXT,
-                embedding BLOB
+                embedding BLOB,
+                row_offset INTEGER
             )
             """
         )
+        columns = {
+            row["name"] for row in self._conn.execute("PRAGMA table_info(chunks)")
+        }
+        if "row_offset" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN row_offset INTEGER")
         self._conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_chunks_user_doc ON chunks(user_id, doc_id)"
         )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
         self._conn.commit()
 
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM store_meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row["value"] if row else None
+
+    def _dim(self) -> Optional[int]:
+        value = self._meta("embedding_dim")
+        return int(value) if value is not None else None
+
+    def _dtype(self) -> np.dtype:
+        # Fixed when the file is created; files that predate the setting are
+        # float32.
+        return np.dtype(self._meta("embedding_dtype") or "float32")
+
+    def _check_dim(self, dim: int) -> None:
+        stored = self._dim()
+        if stored is None:
+            # float16 halves the file and the pages read on rebuilds; unit
+            # vectors lose nothing that matters to cosine ranking.
+            dtype = np.dtype(os.getenv("RAG_EMBEDDINGS_DTYPE", "float32"))
+            if dtype not in (np.float32, np.float16):
+                raise ValueError(f"Unsupported RAG_EMBEDDINGS_DTYPE {dtype}.")
+            self._conn.executemany(
+                "INSERT INTO store_meta (key, value) VALUES (?, ?)",
+                [("embedding_dim", str(dim)), ("embedding_dtype", dtype.name)],
+            )
+        elif stored != dim:
+            raise ValueError(
+                f"Embedding dimension {dim} does not match the store's {stored}."
+            )
+
+    def _append_vectors(self, vectors: np.ndarray) -> int:
+        # Write past the last committed row, so bytes left by a batch that
+        # never committed are overwritten. Synced before the rows that point
+        # at them are committed.
+        last = self._conn.execute("SELECT MAX(row_offset) FROM chunks").fetchone()[0]
+        start = 0 if last is None else last + 1
+        dtype = self._dtype()
+        mode = "r+b" if os.path.exists(self.embeddings_path) else "wb"
+        with open(self.embeddings_path, mode) as fh:
+            fh.seek(start * vectors.shape[1] * dtype.itemsize)
+            fh.write(np.ascontiguousarray(vectors, dtype=dtype).tobytes())
+            fh.truncate()
+            fh.flush()
+            os.fsync(fh.fileno())
+        return start
+
+    def _vectors(self, offsets: np.ndarray) -> np.ndarray:
+        dim = self._dim()
+        if dim is None or offsets.size == 0:
+            return np.empty((0, dim or 0), dtype="float32")
+        dtype = self._dtype()
+        rows = os.path.getsize(self.embeddings_path) // (dim * dtype.itemsize)
+        matrix = np.memmap(
+            self.embeddings_path, dtype=dtype, mode="r", shape=(rows, dim)
+        )
+        first = int(offsets[0])
+        if np.array_equal(offsets, np.arange(first, first + offsets.size)):
+            # The usual case: ids and offsets grow together, so this is a view
+            # (a float32 copy for half-precision files).
+            selected = matrix[first : first + offsets.size]
+        else:
+            selected = matrix[offsets]
+        return np.asarray(selected, dtype="float32")
+
+    def _id_offsets(self) -> Tuple[np.ndarray, np.ndarray]:
+        cursor = self._conn.execute(
+            "SELECT id, row_offset FROM chunks WHERE row_offset IS NOT NULL ORDER BY id"
+        )
+        pairs = np.fromiter(chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+    def _migrate_blobs(self) -> None:
+        # Stores created before the embeddings file kept one BLOB per row;
+        # move those vectors into the file once.
+        where = "WHERE row_offset IS NULL AND embedding IS NOT NULL"
+        count = self._conn.execute(f"SELECT COUNT(*) FROM chunks {where}").fetchone()[0]
+        if not count:
+            return
+        # Stream the BLOBs into one preallocated matrix rather than keeping
+        # every row and a per-row array alive until a final vstack copy.
+        ids = np.empty(count, dtype="int64")
+        vectors: Optional[np.ndarray] = None
+        cursor = self._conn.execute(
+            f"SELECT id, embedding FROM chunks {where} ORDER BY id"
+        )
+        for i, (row_id, blob) in enumerate(cursor):
+            if vectors is None:
+                vectors = np.empty((count, len(blob) // 4), dtype="float32")
+            ids[i] = row_id
+            vectors[i] = np.frombuffer(blob, dtype="float32")
+        faiss.normalize_L2(vectors)
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._check_dim(vectors.shape[1])
+            start = self._append_vectors(vectors)
+            self._conn.executemany(
+                "UPDATE chunks SET row_offset = ?, embedding = NULL WHERE id = ?",
+                zip(range(start, start + count), ids.tolist(), strict=True),
+            )
+
     def _load_or_build_index(self) -> Optional[faiss.Index]:
         if os.path.exists(self.index_path):
             try:
-                return faiss.read_index(self.index_path)
+                index = self._read_index()
             except Exception:
                 pass
-        rows = self._conn.execute("SELECT id, embedding FROM chunks").fetchall()
-        if not rows:
-            return None
-        ids = np.array([row["id"] for row in rows], dtype="int64")
-        vectors = np.vstack(
-            [np.frombuffer(row["embedding"], dtype="float32") for row in rows]
-        )
+            else:
+                return self._catch_up(index)
+        return self._build_index()
+
+    def _read_index(self) -> faiss.Index:
+        # RAG_INDEX_MMAP maps IVF inverted lists from the file instead of
+        # reading them in, so worker processes share one copy in the page
+        # cache. Flat indexes are always loaded into memory.
+        flag = os.getenv("RAG_INDEX_MMAP", "")
+        mmap = flag.strip().lower() in {"1", "true", "yes", "on"}
+        index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+        self._mmapped = mmap and faiss.try_extract_index_ivf(index) is not None
+        return _tune(index)
+
+    def _writable(self, index: faiss.Index) -> faiss.Index:
+        # Mapped inverted lists are read-only; the first write loads a private
+        # copy (the file matches the index exactly while it is mapped).
+        if not self._mmapped:
+            return index
+        self._mmapped = False
+        return _tune(faiss.read_index(self.index_path))
+
+    def _catch_up(self, index: faiss.Index) -> faiss.Index:
+        # The file is flushed lazily and every worker process writes it, so it
+        # can lack rows on either side of its largest id. Replay whatever
+        # SQLite holds that the index does not.
+        count = self._conn.execute(
+            "SELECT COUNT(*) FROM chunks WHERE row_offset IS NOT NULL"
+        ).fetchone()[0]
+        if count == index.ntotal:
+            return index
+        ids, offsets = self._id_offsets()
+        missing = ~np.isin(ids, faiss.vector_to_array(index.id_map))
+        if not missing.any():
+            return index
+        index = self._writable(index)
+        index.add_with_ids(self._vectors(offsets[missing]), ids[missing])
+        self._unflushed += int(missing.sum())
+        return index
+
+    def _build_index(self) -> Optional[faiss.Index]:
+        ids, offsets = self._id_offsets()
+        vectors = self._vectors(offsets)
         if vectors.size == 0:
             return None
-        faiss.normalize_L2(vectors)
-        index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        index = _new_index(vectors.shape[1], train=vectors)
         index.add_with_ids(vectors, ids)
-        faiss.write_index(index, self.index_path)
+        self._write_index(index)
+        self._mmapped = False
         return index
 
-    def add_chunks(self, chunks: List[Dict], embeddings: List[List[float]]) -> int:
-        if not chunks or not embeddings:
+    def _write_index(self, index: faiss.Index) -> None:
+        # Write aside and rename so a crash mid-write never leaves a torn file.
+        tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self._unflushed = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._index is not None and self._unflushed:
+                self._write_index(self._index)
+
+    def add_chunks(
+        self, chunks: List[Dict], embeddings: Sequence[Sequence[float]]
+    ) -> int:
+        if not chunks or len(embeddings) == 0:
             return 0
         vectors = np.asarray(embeddings, dtype="float32")
         faiss.normalize_L2(vectors)
-        ids: List[int] = []
-        with self._conn:
-            for chunk, vec in zip(chunks, vectors):
-                cursor = self._conn.execute(
+        rows = [
+            (
+                chunk.get("user_id"),
+                chunk.get("doc_id"),
+                chunk.get("source"),
+                chunk.get("chunk_index"),
+                chunk.get("content"),
+            )
+            for chunk in chunks[: len(vectors)]
+        ]
+        if not rows:
+            return 0
+        vectors = vectors[: len(rows)]
+        with self._write_lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._check_dim(vectors.shape[1])
+                start = self._append_vectors(vectors)
+                self._conn.executemany(
                     """
-                    INSERT INTO chunks (user_id, doc_id, source, chunk_index, content, embedding)
+                    INSERT INTO chunks
+                        (user_id, doc_id, source, chunk_index, content, row_offset)
                     VALUES (?, ?, ?, ?, ?, ?)
                     """,
-                    (
-                        chunk.get("user_id"),
-                        chunk.get("doc_id"),
-                        chunk.get("source"),
-                        chunk.get("chunk_index"),
-                        chunk.get("content"),
-                        vec.tobytes(),
-                    ),
+                    [row + (start + i,) for i, row in enumerate(rows)],
                 )
-                ids.append(int(cursor.lastrowid))
-        if not ids:
-            return 0
-        id_array = np.array(ids, dtype="int64")
-        with self._lock:
-            if self._index is None:
-                self._index = faiss.IndexIDMap2(
-                    faiss.IndexFlatIP(vectors.shape[1])
-                )
-            if self._index.d != vectors.shape[1]:
-                # Rebuild index if dimensions mismatch
-                self._index = self._load_or_build_index()
-            if self._index is None:
-                self._index = faiss.IndexIDMap2(
-                    faiss.IndexFlatIP(vectors.shape[1])
-                )
-            self._index.add_with_ids(vectors, id_array)
-            faiss.write_index(self._index, self.index_path)
-        return len(ids)
+                # The batch runs in one write transaction, so AUTOINCREMENT hands
+                # out consecutive ids ending at the last inserted rowid.
+                last_id = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            id_array = np.arange(last_id - len(rows) + 1, last_id + 1, dtype="int64")
+            with self._lock:
+                if self._index is not None and _needs_rebuild(
+                    self._index, self._index.ntotal + len(rows)
+                ):
+                    # Rebuild from SQLite, which already holds the new rows.
+                    self._index = self._build_index()
+                    self._drop_filters()
+                    return len(rows)
+                if self._index is None:
+                    self._index = _new_index(vectors.shape[1], train=vectors)
+                self._index = self._writable(self._index)
+                self._index.add_with_ids(vectors, id_array)
+                self._drop_filters()
+                # Rewriting the whole index is O(corpus); do it every
+                # RAG_INDEX_FLUSH_EVERY vectors, not every batch.
+                self._unflushed += len(rows)
+                if self._unflushed >= self._flush_every:
+                    self._write_index(self._index)
+        return len(rows)
 
     def search(
         self,
@@ -115,26 +436,187 @@ class FaissStore:
         user_id: Optional[str] = None,
         doc_id: Optional[str] = None,
     ) -> List[Dict]:
-        if self._index is None or self._index.ntotal == 0:
-            return []
-        query = np.asarray([query_vector], dtype="float32")
-        faiss.normalize_L2(query)
-        search_k = min(max(k * 5, k), int(self._index.ntotal))
-        with self._lock:
-            scores, ids = self._index.search(query, search_k)
-        id_list = [int(i) for i in ids[0] if i != -1]
-        if not id_list:
+        return self.search_batch([query_vector], k=k, user_id=user_id, doc_id=doc_id)[0]
+
+    def search_batch(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        k: int = 5,
+        user_id: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> List[List[Dict]]:
+        id_lists, row_map = self._search_ids(query_vectors, k, user_id, doc_id)
+        return [[self._row_dict(row_map[idx]) for idx in ids] for ids in id_lists]
+
+    def search_merged(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        k: int = 5,
+        user_id: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> List[Dict]:
+        # Union of every query's top-k in query order, deduplicated on the
+        # FAISS id before any result dicts are built.
+        id_lists, row_map = self._search_ids(query_vectors, k, user_id, doc_id)
+        flat = np.fromiter(chain.from_iterable(id_lists), dtype=np.int64)
+        if flat.size == 0:
             return []
-        placeholders = ",".join("?" for _ in id_list)
+        _, first = np.unique(flat, return_index=True)
+        return [self._row_dict(row_map[idx]) for idx in flat[np.sort(first)].tolist()]
+
+    def _search_ids(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        k: int,
+        user_id: Optional[str],
+        doc_id: Optional[str],
+    ) -> Tuple[List[List[int]], Dict[int, sqlite3.Row]]:
+        # One FAISS call and one SQLite lookup for every query in the batch.
+        if len(query_vectors) == 0:
+            return [], {}
+        self._sync()
+        if self._index is None or self._index.ntotal == 0:
+            return [[] for _ in query_vectors], {}
+        queries = np.array(query_vectors, dtype="float32", ndmin=2)
+        if not self._assume_normalized:
+            faiss.normalize_L2(queries)
+        # Filters are applied inside FAISS, so nothing needs over-fetching.
+        search_k = min(k, int(self._index.ntotal))
+        selector = None
+        if user_id or doc_id:
+            # Let FAISS skip non-matching ids instead of over-fetching and
+            # discarding them, which starves users with a small share.
+            selector, matches = self._filter(user_id, doc_id)
+            if matches == 0:
+                return [[] for _ in query_vectors], {}
+            search_k = min(k, matches)
+        ids = self._combined_search(queries, search_k, selector)
+        id_lists = [[int(i) for i in row if i != -1] for row in ids]
+        unique_ids = list(dict.fromkeys(i for id_list in id_lists for i in id_list))
+        if not unique_ids:
+            return [[] for _ in query_vectors], {}
+        # The ids travel as one JSON array parameter, so the SQL text is fixed
+        # and sqlite3's statement cache reuses the compiled plan; json_each
+        # feeds straight into rowid lookups.
         rows = self._conn.execute(
-            f"""
-            SELECT id, user_id, doc_id, source, chunk_index, content
-            FROM chunks WHERE id IN ({placeholders})
-            """,
-            id_list,
+            _ROWS_BY_ID_SQL, (f"[{','.join(map(str, unique_ids))}]",)
         ).fetchall()
         row_map = {row["id"]: row for row in rows}
-        results: List[Dict] = []
+        return [
+            self._collect(id_list, row_map, k, user_id, doc_id) for id_list in id_lists
+        ], row_map
+
+    def _sync(self) -> None:
+        # Each worker process keeps its own index, so rows another worker
+        # ingested are replayed before searching. data_version only changes
+        # when another connection commits, so most searches stop here.
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        # A local ingest holds the write lock until its rows are indexed;
+        # leave the catch-up to the next search rather than wait for it.
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+                else:
+                    self._index = self._catch_up(self._index)
+                self._drop_filters()
+            self._data_version = version
+        finally:
+            self._write_lock.release()
+
+    def _filter(
+        self, user_id: Optional[str], doc_id: Optional[str]
+    ) -> Tuple[faiss.IDSelector, int]:
+        key = (user_id or None, doc_id or None)
+        with self._lock:
+            cached = self._filters.get(key)
+            if cached is not None:
+                self._filters.move_to_end(key)
+                return cached
+            epoch = self._filter_epoch
+        clauses, args = [], []
+        if user_id:
+            clauses.append("user_id = ?")
+            args.append(user_id)
+        if doc_id:
+            clauses.append("doc_id = ?")
+            args.append(doc_id)
+        cursor = self._conn.execute(
+            f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", args
+        )
+        ids = np.fromiter(chain.from_iterable(cursor), dtype=np.int64)
+        entry = (faiss.IDSelectorBatch(ids), int(ids.size))
+        with self._lock:
+            if epoch == self._filter_epoch:
+                self._filters[key] = entry
+                if len(self._filters) > FILTER_CACHE_SIZE:
+                    self._filters.popitem(last=False)
+        return entry
+
+    def _drop_filters(self) -> None:
+        self._filters.clear()
+        self._filter_epoch += 1
+
+    def _combined_search(
+        self, queries: np.ndarray, k: int, selector: Optional[faiss.IDSelector]
+    ) -> np.ndarray:
+        # Flat combining: whichever thread gets the index lock runs every
+        # search queued so far as one batched call per selector, so
+        # concurrent requests share a pass over the vectors instead of each
+        # streaming the whole index.
+        job = _SearchJob(queries, k, selector)
+        with self._pending_lock:
+            self._pending.append(job)
+        with self._lock:
+            if job.ids is None and job.error is None:
+                with self._pending_lock:
+                    jobs, self._pending = self._pending, []
+                try:
+                    self._run_jobs(jobs)
+                except BaseException as exc:
+                    for pending in jobs:
+                        if pending.ids is None:
+                            pending.error = exc
+        if job.error is not None:
+            raise job.error
+        return job.ids
+
+    def _run_jobs(self, jobs: List["_SearchJob"]) -> None:
+        groups: Dict[int, List[_SearchJob]] = {}
+        for job in jobs:
+            groups.setdefault(id(job.selector), []).append(job)
+        for group in groups.values():
+            selector = group[0].selector
+            params = self._search_params(selector) if selector is not None else None
+            batch = np.vstack([job.queries for job in group])
+            k = max(job.k for job in group)
+            # Top-k is a prefix of top-max(k), so one search serves every k.
+            _, ids = self._index.search(batch, k, params=params)
+            offset = 0
+            for job in group:
+                job.ids = ids[offset : offset + len(job.queries), : job.k]
+                offset += len(job.queries)
+
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        # Per-call parameters replace the index's own, so carry nprobe over.
+        ivf = faiss.try_extract_index_ivf(self._index)
+        if ivf is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    @staticmethod
+    def _collect(
+        id_list: List[int],
+        row_map: Dict[int, sqlite3.Row],
+        k: int,
+        user_id: Optional[str],
+        doc_id: Optional[str],
+    ) -> List[int]:
+        kept: List[int] = []
         for idx in id_list:
             row = row_map.get(idx)
             if row is None:
@@ -143,30 +625,53 @@ class FaissStore:
                 continue
             if doc_id and row["doc_id"] != doc_id:
                 continue
-            results.append(
-                {
-                    "content": row["content"],
-                    "user_id": row["user_id"],
-                    "doc_id": row["doc_id"],
-                    "source": row["source"],
-                    "chunk_index": row["chunk_index"],
-                }
-            )
-            if len(results) >= k:
+            kept.append(idx)
+            if len(kept) >= k:
                 break
-        return results
+        return kept
+
+    @staticmethod
+    def _row_dict(row: sqlite3.Row) -> Dict:
+        return {
+            "content": row["content"],
+            "user_id": row["user_id"],
+            "doc_id": row["doc_id"],
+            "source": row["source"],
+            "chunk_index": row["chunk_index"],
+        }
+
+    def warmup(self) -> None:
+        # One throwaway search and row read so the first real query does not
+        # pay for page faults and lazy initialisation.
+        self._conn.execute("SELECT id FROM chunks LIMIT 1").fetchall()
+        if self._index is None or self._index.ntotal == 0:
+            return
+        probe = np.zeros((1, self._index.d), dtype="float32")
+        with self._lock:
+            self._index.search(probe, 1)
 
     def close(self) -> None:
+        self.flush()
         self._conn.close()
 
 
 _store: Optional[FaissStore] = None
+_store_lock = threading.Lock()
 
 
 def get_store() -> FaissStore:
     global _store
     if _store is None:
-        db_path = os.getenv("RAG_DB_PATH", "data/rag.db")
-        index_path = os.getenv("RAG_INDEX_PATH", "data/faiss.index")
-        _store = FaissStore(db_path, index_path)
+        # Loading the index is expensive; make sure concurrent first callers
+        # build it once.
+        with _store_lock:
+            if _store is None:
+                db_path = os.getenv("RAG_DB_PATH", "data/rag.db")
+                index_path = os.getenv("RAG_INDEX_PATH", "data/faiss.index")
+                embeddings_path = os.getenv(
+                    "RAG_EMBEDDINGS_PATH", "data/embeddings.f32"
+                )
+                store = FaissStore(db_path, index_path, embeddings_path)
+                atexit.register(store.flush)
+                _store = store
     return _store
@@ -1,32 +1,69 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from .embeddings import embed_texts
+import numpy as np
 
+from .embeddings import embed_texts, l2_normalize
 
-def _dot(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
 
-
-def _norm(a: List[float]) -> float:
-    return _dot(a, a) ** 0.5
+def _rank_by_cosine(
+    query_emb: Sequence[float],
+    docs: List[Dict],
+    doc_embs: np.ndarray,
+    k: Optional[int] = None,
+) -> List[Tuple[Dict, float]]:
+    # Both sides are unit-length, so the dot product is the cosine score.
+    if not docs:
+        return []
+    q = np.asarray(query_emb, dtype=np.float32)
+    scores = doc_embs @ q
+    if k is None or k >= len(docs):
+        # Stable sort keeps input order for ties, like the previous list.sort.
+        order = np.argsort(-scores, kind="stable")
+    elif k <= 0:
+        return []
+    else:
+        # Only the k winners need ordering; partition the rest away in O(D).
+        top = np.argpartition(-scores, k - 1)[:k]
+        order = top[np.lexsort((top, -scores[top]))]
+    return [(docs[i], float(scores[i])) for i in order]
 
 
-def rerank_with_scores(query: str, docs: List[Dict]) -> List[Tuple[Dict, float]]:
+def rerank_with_scores(
+    query: str,
+    docs: List[Dict],
+    k: Optional[int] = None,
+) -> List[Tuple[Dict, float]]:
     if not docs:
         return []
 
-    query_emb = embed_texts([query])[0]
-    doc_embs = embed_texts([doc.get("content", "") for doc in docs])
-    qn = _norm(query_emb) or 1.0
+    # Query and candidates go out as one embeddings batch, not two round-trips.
+    embs = l2_normalize(embed_texts([query] + [doc.get("content", "") for doc in docs]))
+    return _rank_by_cosine(embs[0], docs, embs[1:], k=k)
+
 
-    scores = []
-    for i, emb in enumerate(doc_embs):
-        dn = _norm(emb) or 1.0
-        score = _dot(query_emb, emb) / (qn * dn)
-        scores.append((i, score))
+def rerank_batch(
+    query_embs: Sequence[Sequence[float]],
+    docs_per_query: List[List[Dict]],
+    k: Optional[int] = None,
+) -> List[List[Tuple[Dict, float]]]:
+    # query_embs must already be L2-normalized. Embed every candidate in one
+    # pass and split back by offset, so N queries cost one embeddings request
+    # instead of N.
+    contents = [
+        doc.get("content", "") for docs in docs_per_query for doc in docs
+    ]
+    doc_embs = l2_normalize(embed_texts(contents)) if contents else np.empty((0, 0))
 
-    scores.sort(key=lambda x: x[1], reverse=True)
-    return [(docs[i], score) for i, score in scores]
+    ranked: List[List[Tuple[Dict, float]]] = []
+    offset = 0
+    for query_emb, docs in zip(query_embs, docs_per_query, strict=True):
+        ranked.append(
+            _rank_by_cosine(
+                query_emb, docs, doc_embs[offset : offset + len(docs)], k=k
+            )
+        )
+        offset += len(docs)
+    return ranked
 
 
 def rerank(query: str, docs: List[Dict]) -> List[Dict]:
@@ -1,6 +1,7 @@
 import os
 import time
 import uuid
+from collections import deque
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict
 
@@ -13,22 +14,51 @@ INGEST_URL = f"{API_BASE_URL}/api/ingest/file"
 SESSION_URL = f"{API_BASE_URL}/api/session"
 
 
-def post_query(payload: Dict[str, Any]) -> Dict[str, Any]:
-    with httpx.Client(timeout=60) as client:
-        resp = client.post(
-            API_URL, json=payload, headers={"X-Session-Id": st.session_state.user_id}
-        )
-        resp.raise_for_status()
-        return resp.json()
+@st.cache_resource
+def _client() -> httpx.Client:
+    # Shared across reruns and sessions so keep-alive connections to the API
+    # survive between requests instead of a new handshake per call.
+    try:
+        import h2  # noqa: F401
+
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.Client(
+        timeout=60,
+        limits=httpx.Limits(max_keepalive_connections=8),
+        http2=http2,
+    )
+
+
+def post_query(payload: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    resp = _client().post(API_URL, json=payload, headers={"X-Session-Id": user_id})
+    resp.raise_for_status()
+    return resp.json()
+
+def fetch_followups(followups_id: str, attempts: int = 20, delay: float = 0.5) -> list:
+    # Follow-ups are generated after /api/query responds; poll briefly.
+    client = _client()
+    for _ in range(attempts):
+        resp = client.get(f"{API_URL}/followups/{followups_id}", timeout=10)
+        if resp.status_code != 200:
+            return []
+        data = resp.json()
+        if data.get("status") == "ready":
+            return data.get("follow_ups") or []
+        time.sleep(delay)
+    return []
 
 def ingest_pdf(user_id: str, file) -> Dict[str, Any]:
-    files = {"file": (file.name, file.getvalue(), "application/pdf")}
-    with httpx.Client(timeout=120) as client:
-        resp = client.post(
-            INGEST_URL, files=files, headers={"X-Session-Id": user_id}
-        )
-        resp.raise_for_status()
-        return resp.json()
+    # Hand httpx the upload itself so the multipart body is streamed from it
+    # rather than from a second in-memory copy.
+    file.seek(0)
+    files = {"file": (file.name, file, "application/pdf")}
+    resp = _client().post(
+        INGEST_URL, files=files, headers={"X-Session-Id": user_id}, timeout=120
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 def ensure_user_id() -> str:
     params = st.query_params
@@ -36,12 +66,11 @@ def ensure_user_id() -> str:
         return params["uid"]
     for attempt in range(3):
         try:
-            with httpx.Client(timeout=30) as client:
-                resp = client.get(SESSION_URL)
-                resp.raise_for_status()
-                user_id = resp.json()["user_id"]
-                st.query_params["uid"] = user_id
-                return user_id
+            resp = _client().get(SESSION_URL, timeout=30)
+            resp.raise_for_status()
+            user_id = resp.json()["user_id"]
+            st.query_params["uid"] = user_id
+            return user_id
         except Exception as exc:
             time.sleep(1 + attempt)
     st.error(
@@ -60,12 +89,14 @@ if "doc_ids" not in st.session_state:
 if "active_doc_id" not in st.session_state:
     st.session_state.active_doc_id = None
 if "chat_turns" not in st.session_state:
-    st.session_state.chat_turns = []
+    st.session_state.chat_turns = deque(maxlen=10)
+if "last_response" not in st.session_state:
+    st.session_state.last_response = None
 if "chat_started_at" not in st.session_state:
     st.session_state.chat_started_at = datetime.now(timezone.utc)
 
 if datetime.now(timezone.utc) - st.session_state.chat_started_at > timedelta(hours=1):
-    st.session_state.chat_turns = []
+    st.session_state.chat_turns = deque(maxlen=10)
     st.session_state.chat_started_at = datetime.now(timezone.utc)
 
 with st.sidebar:
@@ -131,7 +162,7 @@ if st.button("Search"):
         st.warning("Please ingest a document first.")
         st.stop()
     try:
-        data = post_query(payload)
+        data = post_query(payload, st.session_state.user_id)
     except httpx.HTTPStatusError as exc:
         if exc.response.status_code == 429:
             st.warning(
@@ -143,42 +174,58 @@ if st.button("Search"):
     except Exception as exc:
         st.error(f"Request failed: {exc}")
     else:
-        st.subheader("Answer")
-        st.write(data.get("answer", ""))
+        # Kept in the session so widget reruns redraw the last answer without
+        # calling the API (or polling for follow-ups) again. Follow-ups stay
+        # None until they have been fetched below, after the answer is drawn.
+        followups = data.get("follow_ups") or None
+        st.session_state.last_response = {"data": data, "follow_ups": followups}
         st.session_state.chat_turns.append(
             {"query": query, "answer": data.get("answer", "")}
         )
-        if len(st.session_state.chat_turns) > 10:
-            st.session_state.chat_turns = st.session_state.chat_turns[-10:]
 
-        if include_citations:
-            st.subheader("Citations (used)")
-            st.json(data.get("citations", {}).get("used", []))
+if st.session_state.last_response is not None:
+    data = st.session_state.last_response["data"]
+    followups = st.session_state.last_response["follow_ups"]
 
-        st.subheader("Context")
-        st.code(data.get("context", ""), language="text")
+    st.subheader("Answer")
+    st.write(data.get("answer", ""))
 
-        if data.get("tool_used") and data.get("tool_output"):
-            st.subheader(f"Tool output: {data['tool_used']}")
-            st.code(data.get("tool_output", ""), language="text")
+    if include_citations:
+        st.subheader("Citations (used)")
+        st.json(data.get("citations", {}).get("used", []))
 
-        followups = data.get("follow_ups") or []
-        if followups:
-            st.subheader("Follow-up questions")
-            for item in followups:
-                st.markdown(f"- {item}")
+    st.subheader("Context")
+    st.code(data.get("context", ""), language="text")
+
+    if data.get("tool_used") and data.get("tool_output"):
+        st.subheader(f"Tool output: {data['tool_used']}")
+        st.code(data.get("tool_output", ""), language="text")
+
+    followups_slot = st.empty()
 
-        if include_citations:
-            st.subheader("Related citations")
-            st.json(data.get("citations", {}).get("related", []))
+    if include_citations:
+        st.subheader("Related citations")
+        st.json(data.get("citations", {}).get("related", []))
 
-        if show_raw:
-            st.subheader("Raw results")
-            st.json(data.get("results", []))
+    if show_raw:
+        st.subheader("Raw results")
+        st.json(data.get("results", []))
 
-        with st.expander("Full response JSON"):
+    with st.expander("Full response JSON"):
+        # Serialising the whole payload is only worth it when asked for.
+        if st.checkbox("Show full response", value=False):
             st.json(data)
 
+    if followups is None and data.get("followups_id"):
+        with followups_slot, st.spinner("Generating follow-up questions..."):
+            followups = fetch_followups(data["followups_id"])
+        st.session_state.last_response["follow_ups"] = followups
+    if followups:
+        with followups_slot.container():
+            st.subheader("Follow-up questions")
+            for item in followups:
+                st.markdown(f"- {item}")
+
 st.subheader("Chat history")
 if st.session_state.chat_turns:
     for turn in st.session_state.chat_turns:
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from rag_system.app.generation import agentic
+from rag_system.app.generation.agentic import _find_tables, _list_definitions
+
+CONTEXT = (
+    "Intro paragraph without a definition\n"
+    "  API: Application programming interface\r\n"
+    "Latency:   time to first byte\n"
+    "\n"
+    "not a definition:\n"
+    "| col a | col b |\n"
+    "| 1 | 2 |\n"
+    "plain text\n"
+    "x\ty\n"
+)
+
+
+def test_list_definitions_matches_definition_lines():
+    assert _list_definitions(CONTEXT) == (
+        "- API: Application programming interface\n"
+        "- Latency: time to first byte"
+    )
+    assert _list_definitions("nothing here").startswith("No definition-style")
+    # Same line boundaries as str.splitlines(), e.g. PDF form feeds.
+    assert _list_definitions("Term: one\fNext: two\u2028Last: three\rEnd") == (
+        "- Term: one\n- Next: two\n- Last: three"
+    )
+
+
+def test_find_tables_groups_consecutive_separator_lines():
+    assert _find_tables(CONTEXT) == "| col a | col b |\n| 1 | 2 |\n\nx\ty"
+    assert _find_tables("no tables").startswith("No tables found")
+
+
+async def test_select_tool_reuses_cached_decision(monkeypatch):
+    monkeypatch.setattr(agentic, "_tool_cache", agentic.OrderedDict())
+    monkeypatch.setattr(agentic, "_redis", lambda: None)
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content='{"tool": "summarize", "reason": "long"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    assert await agentic.select_tool(client, "Sum it up", CONTEXT) == "summarize"
+    assert await agentic.select_tool(client, "sum it up ", CONTEXT) == "summarize"
+    assert len(calls) == 1
+    await agentic.select_tool(client, "Sum it up", CONTEXT + "more")
+    assert len(calls) == 2
+
+
+def test_redis_connection_failures_are_retried_later(monkeypatch):
+    clock = [100.0]
+    attempts = []
+    monkeypatch.setattr(agentic.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(agentic, "_redis_client", None)
+    monkeypatch.setattr(agentic, "_redis_retry_at", 0.0)
+    monkeypatch.setattr(agentic, "get_redis_client", lambda: attempts.append(1))
+    assert agentic._redis() is None
+    assert agentic._redis() is None
+    assert len(attempts) == 1
+    client = object()
+    monkeypatch.setattr(agentic, "get_redis_client", lambda: client)
+    clock[0] += agentic.REDIS_RETRY_SECONDS
+    assert agentic._redis() is client
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from rag_system.app.retrieval.bm25_retriever import BM25Retriever
+
+DOCS = [
+    "the cat sat on the mat",
+    "dogs chase cats in the park",
+    "a cat and a dog are friends",
+    "stock markets fell sharply today",
+    "cat cat cat",
+]
+
+
+def _full_ranking(retriever, query):
+    scores = retriever.get_scores(query)
+    return sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+
+
+def test_top_n_matches_full_sort():
+    retriever = BM25Retriever(DOCS)
+    expected = _full_ranking(retriever, "cat")
+    for n in range(1, len(DOCS) + 2):
+        assert retriever.get_top_n("cat", n=n) == expected[:n]
+
+
+def test_scores_match_rank_bm25():
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    reference = rank_bm25.BM25Okapi([doc.split() for doc in DOCS])
+    retriever = BM25Retriever(DOCS)
+    for query in ["cat", "cat dog", "the cat cat", "unknown words", ""]:
+        np.testing.assert_allclose(
+            retriever.get_scores(query),
+            reference.get_scores(query.split()),
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+
+def test_maxscore_pruning_matches_exhaustive_ranking():
+    rng = np.random.default_rng(0)
+    vocab = [f"w{i}" for i in range(40)]
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+    docs = [
+        " ".join(rng.choice(vocab, size=rng.integers(5, 60), p=weights))
+        for _ in range(300)
+    ]
+    retriever = BM25Retriever(docs)
+    for query in ["w0 w7 w31", "w2 w2 w15", "w39 w1 w5 w12"]:
+        scores = retriever.get_scores(query)
+        for n in (1, 5, 20):
+            ranked = retriever.get_top_n_with_scores(query, n=n)
+            assert [i for i, _ in ranked] == _full_ranking(retriever, query)[:n]
+            np.testing.assert_allclose(
+                [s for _, s in ranked], scores[[i for i, _ in ranked]], rtol=1e-5
+            )
+
+
+def test_top_n_with_scores_is_descending():
+    retriever = BM25Retriever(DOCS)
+    ranked = retriever.get_top_n_with_scores("cat dog", n=3)
+    assert len(ranked) == 3
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores, reverse=True)
+    assert retriever.get_top_n_docs("cat dog", n=1) == [DOCS[ranked[0][0]]]
+
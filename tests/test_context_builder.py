@@ -1,4 +1,4 @@
-from rag_system.app.response.context_builder import build_context
+from rag_system.app.response.context_builder import build_context, count_tokens
 
 
 def test_build_context_limits_and_returns_used_chunks():
@@ -7,7 +7,10 @@ def test_build_context_limits_and_returns_used_chunks():
         {"source": "a.txt", "chunk_index": 1, "content": "B" * 10},
         {"source": "a.txt", "chunk_index": 2, "content": "C" * 10},
     ]
-    context, used = build_context("q", chunks, max_tokens=60)
+    budget = count_tokens("[a.txt#0] " + "A" * 10 + "\n") + count_tokens(
+        "[a.txt#1] " + "B" * 10 + "\n"
+    )
+    context, used = build_context("q", chunks, max_tokens=budget)
     assert "[a.txt#0]" in context
     assert "[a.txt#1]" in context
     assert "[a.txt#2]" not in context
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag_system.app.retrieval import embeddings
+
+
+def test_embed_texts_only_requests_cache_misses(monkeypatch, tmp_path):
+    monkeypatch.setenv("RAG_EMBED_CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(embeddings, "_cache", None)
+    monkeypatch.setattr(embeddings, "_memory", None)
+    requested = []
+
+    def fake_request(texts):
+        requested.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(embeddings, "_request_embeddings", fake_request)
+
+    first = embeddings.embed_texts(["a", "bb", "a"])
+    second = embeddings.embed_texts(["bb", "ccc"])
+
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert second == [[2.0, 1.0], [3.0, 1.0]]
+    assert requested == [["a", "bb"], ["ccc"]]
+    embeddings.get_embedding_cache().close()
+
+
+def test_embedding_cache_keeps_float32_precision(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path / "cache.db"))
+    vec = [0.123456789, -0.000123456]
+    cache.put_many({"k": vec})
+    assert cache.get_many(["k"])["k"] == np.asarray(vec, dtype=np.float32).tolist()
+    cache.close()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = embeddings.MemoryEmbeddingCache(capacity=2)
+    cache.put_many({"a": [1.0, 0.0], "b": [0.0, 1.0]})
+    assert cache.get_many(["a"]) == {"a": [1.0, 0.0]}
+    cache.put_many({"c": [0.5, 0.5]})
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0, 0.0], "c": [0.5, 0.5]}
+
+
+async def test_embed_texts_batched_splits_misses_into_requests(monkeypatch):
+    monkeypatch.setenv("RAG_EMBED_CACHE_PATH", "")
+    monkeypatch.setattr(embeddings, "_memory", None)
+    batches = []
+
+    class FakeEmbeddings:
+        async def create(self, model, input):
+            batches.append(list(input))
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=[float(t)]) for t in input]
+            )
+
+    monkeypatch.setattr(
+        embeddings,
+        "_async_client",
+        lambda: SimpleNamespace(embeddings=FakeEmbeddings()),
+    )
+
+    texts = [str(i) for i in range(5)] + ["0"]
+    result = await embeddings.embed_texts_batched(texts, batch_size=2)
+
+    assert result == [[0.0], [1.0], [2.0], [3.0], [4.0], [0.0]]
+    assert sorted(batches) == [["0", "1"], ["2", "3"], ["4"]]
+
+
+async def test_embed_texts_coalesced_merges_concurrent_calls(monkeypatch):
+    calls = []
+
+    async def fake_batched(texts):
+        calls.append(list(texts))
+        return [[float(t)] for t in texts]
+
+    monkeypatch.setattr(embeddings, "embed_texts_batched", fake_batched)
+    monkeypatch.setattr(embeddings, "_batcher", None)
+
+    results = await asyncio.gather(
+        embeddings.embed_texts_coalesced(["1"]),
+        embeddings.embed_texts_coalesced(["2", "3"]),
+    )
+
+    assert results == [[[1.0]], [[2.0], [3.0]]]
+    assert calls == [["1", "2", "3"]]
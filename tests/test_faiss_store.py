@@ -0,0 +1,235 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+import pytest
+
+from rag_system.app.retrieval.faiss_store import FaissStore
+
+
+def _store(tmp_path, n=40, dim=16):
+    store = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    vectors = np.random.default_rng(0).normal(size=(n, dim)).astype("float32")
+    chunks = [
+        {
+            "content": f"chunk {i}",
+            "user_id": f"u{i % 2}",
+            "doc_id": "doc",
+            "source": "doc.txt",
+            "chunk_index": i,
+        }
+        for i in range(n)
+    ]
+    store.add_chunks(chunks, vectors)
+    return store, vectors
+
+
+def test_search_returns_nearest_chunks_with_filters(tmp_path):
+    store, vectors = _store(tmp_path)
+    assert store.search(vectors[3], k=1)[0]["chunk_index"] == 3
+    filtered = store.search(vectors[3], k=3, user_id="u0")
+    assert len(filtered) == 3
+    assert all(doc["user_id"] == "u0" for doc in filtered)
+    store.close()
+
+
+def test_search_merged_dedups_across_queries_in_order(tmp_path):
+    store, vectors = _store(tmp_path)
+    queries = vectors[[5, 5, 9]]
+    per_query = store.search_batch(queries, k=4)
+    expected = []
+    for results in per_query:
+        for doc in results:
+            if doc not in expected:
+                expected.append(doc)
+    assert store.search_merged(queries, k=4) == expected
+    assert store.search_merged([], k=4) == []
+    store.close()
+
+
+def test_ivf_index_replaces_flat_once_corpus_is_large_enough(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_TYPE", "ivf")
+    monkeypatch.setenv("RAG_IVF_MIN_VECTORS", "60")
+    monkeypatch.setenv("RAG_IVF_NPROBE", "64")
+    store, vectors = _store(tmp_path)
+    assert faiss.try_extract_index_ivf(store._index) is None
+    more = np.random.default_rng(1).normal(size=(40, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u0", "doc_id": "doc", "source": "x"}
+    store.add_chunks([dict(chunk, chunk_index=i) for i in range(40)], more)
+    ivf = faiss.try_extract_index_ivf(store._index)
+    assert ivf is not None and ivf.nprobe == 64
+    assert store._index.ntotal == 80
+    assert store.search(vectors[3], k=1)[0]["chunk_index"] == 3
+    store.close()
+
+
+def test_ivfpq_index_compresses_vectors(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_TYPE", "ivfpq")
+    monkeypatch.setenv("RAG_IVF_MIN_VECTORS", "300")
+    monkeypatch.setenv("RAG_PQ_M", "5")
+    store, vectors = _store(tmp_path, n=300)
+    ivf = faiss.downcast_index(store._index.index)
+    assert isinstance(ivf, faiss.IndexIVFPQ)
+    assert ivf.pq.M == 4
+    assert len(store.search(vectors[3], k=5)) == 5
+    store.close()
+
+
+def test_mmapped_ivf_index_reloads_before_writes(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_TYPE", "ivf")
+    monkeypatch.setenv("RAG_IVF_MIN_VECTORS", "100")
+    store, vectors = _store(tmp_path, n=200)
+    store.close()
+    monkeypatch.setenv("RAG_INDEX_MMAP", "1")
+    reopened = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    assert reopened._mmapped
+    assert reopened.search(vectors[7], k=1)[0]["chunk_index"] == 7
+    more = np.random.default_rng(4).normal(size=(3, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u0", "doc_id": "doc", "source": "x"}
+    reopened.add_chunks([dict(chunk, chunk_index=300 + i) for i in range(3)], more)
+    assert not reopened._mmapped
+    assert reopened.search(more[1], k=1)[0]["chunk_index"] == 301
+    reopened.close()
+
+
+def test_add_chunks_maps_faiss_ids_to_inserted_rows(tmp_path):
+    store, _ = _store(tmp_path, n=10)
+    more = np.random.default_rng(2).normal(size=(5, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u0", "doc_id": "doc", "source": "x"}
+    assert store.add_chunks([dict(chunk, chunk_index=i) for i in range(5)], more) == 5
+    for i, vec in enumerate(more):
+        assert store.search(vec, k=1)[0]["chunk_index"] == i
+    store.close()
+
+
+def test_file_backed_store_uses_wal(tmp_path):
+    store, _ = _store(tmp_path, n=2)
+    assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert not store._conn.in_transaction
+    store.close()
+
+
+def test_unflushed_vectors_are_replayed_on_reload(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_FLUSH_EVERY", "20")
+    store, vectors = _store(tmp_path, n=30)
+    more = np.random.default_rng(3).normal(size=(5, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u0", "doc_id": "doc", "source": "x"}
+    store.add_chunks([dict(chunk, chunk_index=100 + i) for i in range(5)], more)
+    # Simulate a crash: the file still holds only the first batch.
+    reopened = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    assert reopened._index.ntotal == 35
+    assert reopened.search(more[2], k=1)[0]["chunk_index"] == 102
+    reopened.close()
+    assert faiss.read_index(str(tmp_path / "faiss.index")).ntotal == 35
+
+
+def test_reload_replays_rows_missing_below_the_largest_id(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_FLUSH_EVERY", "1000")
+    store, _ = _store(tmp_path, n=20)
+    store.flush()
+    # Two workers ingest in turn; the one with the higher ids flushes last,
+    # so the file is missing the other worker's lower ids.
+    other = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    rng = np.random.default_rng(5)
+    first, second = rng.normal(size=(2, 4, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u0", "doc_id": "doc", "source": "x"}
+    store.add_chunks([dict(chunk, chunk_index=100 + i) for i in range(4)], first)
+    other.add_chunks([dict(chunk, chunk_index=200 + i) for i in range(4)], second)
+    store.flush()
+    other.flush()
+    reopened = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    assert reopened._index.ntotal == 28
+    assert reopened.search(first[1], k=1)[0]["chunk_index"] == 101
+    assert reopened.search(second[2], k=1)[0]["chunk_index"] == 202
+    for s in (store, other, reopened):
+        s.close()
+
+
+def test_search_picks_up_rows_ingested_by_another_worker(tmp_path):
+    store, vectors = _store(tmp_path, n=20)
+    other = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    more = np.random.default_rng(6).normal(size=(3, 16)).astype("float32")
+    chunk = {"content": "extra", "user_id": "u1", "doc_id": "new", "source": "x"}
+    assert store.search(vectors[0], k=1, user_id="u1", doc_id="new") == []
+    other.add_chunks([dict(chunk, chunk_index=300 + i) for i in range(3)], more)
+    assert store.search(more[2], k=1)[0]["chunk_index"] == 302
+    assert len(store.search(more[0], k=5, user_id="u1", doc_id="new")) == 3
+    store.close()
+    other.close()
+
+
+def test_legacy_blob_rows_move_to_embeddings_file(tmp_path):
+    db_path = tmp_path / "rag.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        """
+        CREATE TABLE chunks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, doc_id TEXT,
+            source TEXT, chunk_index INTEGER, content TEXT, embedding BLOB
+        )
+        """
+    )
+    vectors = np.random.default_rng(4).normal(size=(6, 8)).astype("float32")
+    conn.executemany(
+        "INSERT INTO chunks (source, chunk_index, content, embedding) "
+        "VALUES (?, ?, ?, ?)",
+        [("old.txt", i, f"old {i}", vec.tobytes()) for i, vec in enumerate(vectors)],
+    )
+    conn.commit()
+    conn.close()
+
+    store = FaissStore(str(db_path), str(tmp_path / "faiss.index"))
+    assert store.search(vectors[4], k=1)[0]["chunk_index"] == 4
+    blobs = store._conn.execute("SELECT COUNT(embedding) FROM chunks").fetchone()[0]
+    assert blobs == 0
+    assert (tmp_path / "embeddings.f32").stat().st_size == 6 * 8 * 4
+    with pytest.raises(ValueError):
+        store.add_chunks([{"content": "x"}], np.ones((1, 4), dtype="float32"))
+    store.close()
+
+
+def test_filtered_search_reaches_rare_users(tmp_path):
+    store, vectors = _store(tmp_path, n=200)
+    rare = np.random.default_rng(5).normal(size=(2, 16)).astype("float32")
+    chunk = {"content": "rare", "user_id": "rare", "doc_id": "doc", "source": "r"}
+    store.add_chunks([dict(chunk, chunk_index=i) for i in range(2)], rare)
+    # The query sits on a common vector, so rare rows are far outside k*5.
+    results = store.search(vectors[0], k=2, user_id="rare")
+    assert sorted(doc["chunk_index"] for doc in results) == [0, 1]
+    assert store.search(vectors[0], k=2, user_id="nobody") == []
+    store.close()
+
+
+def test_concurrent_searches_match_sequential_results(tmp_path):
+    store, vectors = _store(tmp_path, n=100)
+    calls = [(vectors[i], 1 + i % 4, "u0" if i % 3 == 0 else None) for i in range(60)]
+
+    def run(call):
+        vec, k, user_id = call
+        return store.search(vec, k=k, user_id=user_id)
+
+    expected = [run(call) for call in calls]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(run, calls)) == expected
+    store.close()
+
+
+def test_assume_normalized_skips_query_normalisation(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_ASSUME_NORMALIZED", "1")
+    store, vectors = _store(tmp_path)
+    unit = vectors[7] / np.linalg.norm(vectors[7])
+    assert store.search(unit, k=1)[0]["chunk_index"] == 7
+    store.close()
+
+
+def test_float16_embeddings_file_rebuilds_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_EMBEDDINGS_DTYPE", "float16")
+    store, vectors = _store(tmp_path)
+    store.close()
+    assert (tmp_path / "embeddings.f32").stat().st_size == 40 * 16 * 2
+    (tmp_path / "faiss.index").unlink()
+    monkeypatch.delenv("RAG_EMBEDDINGS_DTYPE")
+    reopened = FaissStore(str(tmp_path / "rag.db"), str(tmp_path / "faiss.index"))
+    assert reopened.search(vectors[11], k=1)[0]["chunk_index"] == 11
+    reopened.close()
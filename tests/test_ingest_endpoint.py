@@ -0,0 +1,24 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from rag_system.app.api.ingest import router as ingest_router
+from rag_system.app.observability.ratelimit import rate_limiter
+
+
+def test_ingest_rejects_oversized_upload(monkeypatch):
+    monkeypatch.setenv("MAX_UPLOAD_MB", "1")
+    rate_limiter._windows.clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("oversized upload should not be parsed")
+
+    monkeypatch.setattr("rag_system.app.api.ingest._extract_text", fail)
+
+    app = FastAPI()
+    app.include_router(ingest_router, prefix="/api")
+    client = TestClient(app)
+    resp = client.post(
+        "/api/ingest/file",
+        files={"file": ("big.pdf", b"x" * (1024 * 1024 + 1), "application/pdf")},
+    )
+    assert resp.status_code == 413
@@ -0,0 +1,46 @@
+import json
+import logging
+import queue
+import sys
+
+from rag_system.app.observability.logging import (
+    ContextQueueHandler,
+    JsonFormatter,
+    request_id_var,
+)
+
+
+def test_json_formatter_keeps_extras_and_drops_unset_ids():
+    record = logging.LogRecord(
+        "rag", logging.INFO, __file__, 1, "hello %s", ("x",), None
+    )
+    record.user_id = "u1"
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload["message"] == "hello x"
+    assert payload["user_id"] == "u1"
+    assert "request_id" not in payload and "lineno" not in payload
+
+    token = request_id_var.set("req-1")
+    try:
+        assert json.loads(JsonFormatter().format(record))["request_id"] == "req-1"
+    finally:
+        request_id_var.reset(token)
+
+
+def test_queued_records_keep_request_context():
+    records = queue.SimpleQueue()
+    handler = ContextQueueHandler(records)
+    token = request_id_var.set("req-2")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord(
+            "rag", logging.ERROR, __file__, 1, "failed %d", (7,), sys.exc_info()
+        )
+        handler.emit(record)
+    finally:
+        request_id_var.reset(token)
+    payload = json.loads(JsonFormatter().format(records.get_nowait()))
+    assert payload["message"] == "failed 7"
+    assert payload["request_id"] == "req-2"
+    assert "ValueError: boom" in payload["exc_info"]
@@ -1,10 +1,16 @@
+import asyncio
+import json
 import os
+import threading
 from types import SimpleNamespace
 
+import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
+from rag_system.app.api import query as query_module
 from rag_system.app.api.query import router as query_router
+from rag_system.app.observability.logging import trace_id_var
 from rag_system.app.observability.ratelimit import rate_limiter
 
 
@@ -27,12 +33,25 @@ class DummyStore:
             },
         ][:k]
 
+    def search_batch(self, query_vectors, k=10, user_id=None, doc_id=None):
+        return [
+            self.search(vec, k=k, user_id=user_id, doc_id=doc_id)
+            for vec in query_vectors
+        ]
+
+    def search_merged(self, query_vectors, k=10, user_id=None, doc_id=None):
+        merged = {}
+        for results in self.search_batch(query_vectors, k=k, user_id=user_id, doc_id=doc_id):
+            for doc in results:
+                merged.setdefault((doc["source"], doc["chunk_index"]), doc)
+        return list(merged.values())
+
 
 class DummyOpenAI:
     class _Chat:
         class _Completions:
             @staticmethod
-            def create(**kwargs):
+            async def create(**kwargs):
                 return SimpleNamespace(
                     choices=[SimpleNamespace(message=SimpleNamespace(content="Answer"))],
                     usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
@@ -43,7 +62,7 @@ class DummyOpenAI:
     chat = _Chat()
 
 
-def test_query_endpoint_basic(monkeypatch):
+def _make_app(monkeypatch):
     os.environ["OPENAI_API_KEY"] = "test"
 
     app = FastAPI()
@@ -55,19 +74,26 @@ def test_query_endpoint_basic(monkeypatch):
         lambda: DummyStore(),
     )
     monkeypatch.setattr(
-        "rag_system.app.api.query.OpenAI",
+        "rag_system.app.api.query.AsyncOpenAI",
         lambda api_key=None: DummyOpenAI(),
     )
+    async def fake_embed(texts):
+        return [[0.1, 0.2] for _ in texts]
+
     monkeypatch.setattr(
-        "rag_system.app.api.query.embed_texts",
-        lambda texts: [[0.1, 0.2] for _ in texts],
+        "rag_system.app.api.query.embed_texts_coalesced",
+        fake_embed,
     )
     monkeypatch.setattr(
         "rag_system.app.api.query.rerank_with_scores",
-        lambda q, docs: [(d, 1.0) for d in docs],
+        lambda q, docs, k=None: [(d, 1.0) for d in docs][:k],
     )
-    rate_limiter._events.clear()
+    rate_limiter._windows.clear()
+    return app
 
+
+def test_query_endpoint_basic(monkeypatch):
+    app = _make_app(monkeypatch)
     client = TestClient(app)
     resp = client.post(
         "/api/query",
@@ -86,3 +112,194 @@ def test_query_endpoint_basic(monkeypatch):
     data = resp.json()
     assert data["answer"] == "Answer"
     assert len(data["results"]) == 2
+
+
+def test_query_endpoint_discards_speculative_answer_for_tools(monkeypatch):
+    app = _make_app(monkeypatch)
+    generated = []
+
+    async def fake_select_tool(client, query, context_text, enable_doc_actions=True):
+        return "summarize"
+
+    async def fake_run_tool(client, tool, query, context_text, used_chunks):
+        return "tool result"
+
+    async def fake_create(**kwargs):
+        content = kwargs["messages"][-1]["content"]
+        generated.append(content)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=None,
+        )
+
+    monkeypatch.setattr("rag_system.app.api.query.select_tool", fake_select_tool)
+    monkeypatch.setattr("rag_system.app.api.query.run_tool", fake_run_tool)
+    monkeypatch.setattr(DummyOpenAI._Chat._Completions, "create", staticmethod(fake_create))
+
+    resp = TestClient(app).post(
+        "/api/query",
+        json={"query": "test", "k": 2, "enable_tools": True, "enable_followups": False},
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["tool_used"] == "summarize"
+    assert "Tool output (summarize):\ntool result" in data["answer"]
+
+
+def test_query_endpoint_streams_answer_tokens(monkeypatch):
+    app = _make_app(monkeypatch)
+
+    async def fake_stream():
+        for text in ["Hel", "lo"]:
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))],
+                usage=None,
+            )
+        yield SimpleNamespace(
+            choices=[],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2, total_tokens=12),
+        )
+
+    async def fake_create(**kwargs):
+        assert kwargs["stream"] is True
+        return fake_stream()
+
+    monkeypatch.setattr(DummyOpenAI._Chat._Completions, "create", staticmethod(fake_create))
+
+    resp = TestClient(app).post(
+        "/api/query",
+        json={
+            "query": "test",
+            "k": 2,
+            "stream": True,
+            "enable_tools": False,
+            "enable_followups": False,
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in resp.text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line.removeprefix("event: "), json.loads(data_line[6:])))
+    assert [name for name, _ in events] == ["meta", "token", "token", "done"]
+    assert len(events[0][1]["results"]) == 2
+    assert events[-1][1] == {"answer": "Hello"}
+
+
+def test_query_endpoint_times_out_slow_generation(monkeypatch):
+    app = _make_app(monkeypatch)
+    monkeypatch.setenv("OPENAI_TIMEOUT_SECONDS", "0.05")
+
+    async def slow_create(**kwargs):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(DummyOpenAI._Chat._Completions, "create", staticmethod(slow_create))
+
+    resp = TestClient(app).post(
+        "/api/query",
+        json={"query": "test", "k": 2, "enable_tools": False, "enable_followups": False},
+    )
+    assert resp.status_code == 504
+
+
+def test_query_endpoint_delivers_followups_after_response(monkeypatch):
+    app = _make_app(monkeypatch)
+
+    async def fake_followups(client, query, answer, context_text):
+        return [f"More about {answer}?"]
+
+    monkeypatch.setattr("rag_system.app.api.query.generate_followups", fake_followups)
+
+    client = TestClient(app)
+    resp = client.post(
+        "/api/query",
+        json={"query": "test", "k": 2, "enable_tools": False, "enable_followups": True},
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["follow_ups"] == []
+    followups = client.get(f"/api/query/followups/{data['followups_id']}")
+    assert followups.json() == {"status": "ready", "follow_ups": ["More about Answer?"]}
+    assert client.get("/api/query/followups/unknown").status_code == 404
+
+
+def test_followup_store_is_shared_through_redis(monkeypatch):
+    keys = {}
+
+    class FakeRedis:
+        def set(self, key, value, ex=None, xx=False):
+            if xx and key not in keys:
+                return None
+            keys[key] = value
+            return True
+
+        def get(self, key):
+            return keys.get(key)
+
+    monkeypatch.setattr(query_module, "get_redis_client", lambda **_: FakeRedis())
+    # Two stores stand in for two workers sharing one Redis.
+    writer, reader = query_module.FollowupStore(), query_module.FollowupStore()
+    followups_id = asyncio.run(writer.reserve())
+    assert reader.get(followups_id) == (True, None)
+    asyncio.run(writer.put(followups_id, ["Why?"]))
+    assert reader.get(followups_id) == (True, ["Why?"])
+    asyncio.run(writer.put("expired", ["Why?"]))
+    assert reader.get("expired") == (False, None)
+
+
+async def test_bounded_thread_keeps_slot_until_thread_finishes(monkeypatch):
+    monkeypatch.setenv("OPENAI_TIMEOUT_SECONDS", "0.05")
+    sem = asyncio.Semaphore(1)
+    done = threading.Event()
+    with pytest.raises(asyncio.TimeoutError):
+        await query_module._bounded_thread(sem, "reranking", done.wait, 5)
+    assert sem.locked()
+    done.set()
+    for _ in range(100):
+        if not sem.locked():
+            break
+        await asyncio.sleep(0.01)
+    assert not sem.locked()
+
+
+def test_followup_store_treats_redis_errors_as_no_followups(monkeypatch):
+    class DownRedis:
+        def set(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+        get = set
+
+    monkeypatch.setattr(query_module, "get_redis_client", lambda **_: DownRedis())
+    store = query_module.FollowupStore()
+    assert asyncio.run(store.reserve()) is None
+    asyncio.run(store.put("abc", ["Why?"]))
+    assert store.get("abc") == (False, None)
+
+
+def test_streamed_answer_keeps_trace_id(monkeypatch):
+    app = _make_app(monkeypatch)
+    span = SimpleNamespace(end=lambda **kwargs: None)
+    trace = SimpleNamespace(id="trace-1", span=lambda **kwargs: span)
+    app.state.langfuse = SimpleNamespace(trace=lambda **kwargs: trace)
+    seen = []
+
+    async def fake_stream():
+        seen.append(trace_id_var.get())
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content="Hi"))],
+            usage=None,
+        )
+
+    async def fake_create(**kwargs):
+        return fake_stream()
+
+    monkeypatch.setattr(DummyOpenAI._Chat._Completions, "create", staticmethod(fake_create))
+
+    resp = TestClient(app).post(
+        "/api/query",
+        json={"query": "test", "k": 2, "stream": True, "enable_tools": False},
+    )
+    assert resp.status_code == 200
+    assert seen == ["trace-1"]
+    assert trace_id_var.get() is None
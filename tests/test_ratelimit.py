@@ -1,6 +1,7 @@
 import pytest
 from fastapi import HTTPException
 
+from rag_system.app.observability import ratelimit
 from rag_system.app.observability.ratelimit import RateLimiter
 
 
@@ -11,3 +12,39 @@ def test_rate_limiter_blocks_after_limit():
     with pytest.raises(HTTPException) as exc:
         limiter.check("query", "user1", limit=2, window_seconds=60)
     assert exc.value.status_code == 429
+
+
+def test_rate_limiter_uses_one_script_call_per_check(monkeypatch):
+    counts = {}
+
+    class FakeRedis:
+        def register_script(self, script):
+            def run(keys, args):
+                counts[keys[0]] = counts.get(keys[0], 0) + 1
+                return counts[keys[0]]
+
+            return run
+
+    monkeypatch.setattr(ratelimit, "get_redis_client", lambda **_: FakeRedis())
+    limiter = ratelimit.RateLimiter()
+    limiter.check("query", "user1", limit=1, window_seconds=60)
+    with pytest.raises(HTTPException):
+        limiter.check("query", "user1", limit=1, window_seconds=60)
+    assert list(counts.values()) == [2]
+
+
+def test_memory_limiter_slides_and_bounds_keys(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(ratelimit, "MEMORY_MAX_KEYS", 2)
+    limiter = RateLimiter()
+    for _ in range(4):
+        limiter.check("query", "user1", limit=4, window_seconds=60)
+    # A quarter into the next window, 3 of the 4 earlier hits still count.
+    clock[0] += 75
+    limiter.check("query", "user1", limit=4, window_seconds=60)
+    with pytest.raises(HTTPException):
+        limiter.check("query", "user1", limit=4, window_seconds=60)
+    limiter.check("query", "user2", limit=4, window_seconds=60)
+    limiter.check("query", "user3", limit=4, window_seconds=60)
+    assert list(limiter._windows) == ["query:user2", "query:user3"]
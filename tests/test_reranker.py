@@ -0,0 +1,54 @@
+import pytest
+
+from rag_system.app.retrieval import reranker
+
+
+def _fake_embed(texts):
+    table = {
+        "q": [1.0, 0.0],
+        "same": [2.0, 0.0],
+        "diag": [1.0, 1.0],
+        "orth": [0.0, 3.0],
+        "empty": [0.0, 0.0],
+    }
+    return [table[t] for t in texts]
+
+
+def test_rerank_with_scores_orders_by_cosine(monkeypatch):
+    monkeypatch.setattr(reranker, "embed_texts", _fake_embed)
+    docs = [{"content": c} for c in ("orth", "empty", "diag", "same")]
+    ranked = reranker.rerank_with_scores("q", docs)
+    assert [doc["content"] for doc, _ in ranked] == ["same", "diag", "orth", "empty"]
+    assert [score for _, score in ranked] == pytest.approx([1.0, 2**-0.5, 0.0, 0.0])
+
+
+def test_rerank_batch_splits_results_per_query(monkeypatch):
+    monkeypatch.setattr(reranker, "embed_texts", _fake_embed)
+    docs_a = [{"content": "orth"}, {"content": "same"}]
+    docs_b = [{"content": "diag"}]
+    ranked = reranker.rerank_batch(
+        [[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], [docs_a, [], docs_b]
+    )
+    assert [doc["content"] for doc, _ in ranked[0]] == ["same", "orth"]
+    assert ranked[1] == []
+    assert [doc["content"] for doc, _ in ranked[2]] == ["diag"]
+
+
+def test_rerank_with_scores_top_k(monkeypatch):
+    monkeypatch.setattr(reranker, "embed_texts", _fake_embed)
+    docs = [{"content": c} for c in ("orth", "empty", "diag", "same")]
+    ranked = reranker.rerank_with_scores("q", docs, k=2)
+    assert [doc["content"] for doc, _ in ranked] == ["same", "diag"]
+
+
+def test_rerank_with_scores_embeds_once(monkeypatch):
+    calls = []
+
+    def counting_embed(texts):
+        calls.append(list(texts))
+        return _fake_embed(texts)
+
+    monkeypatch.setattr(reranker, "embed_texts", counting_embed)
+    docs = [{"content": c} for c in ("orth", "same")]
+    reranker.rerank_with_scores("q", docs)
+    assert calls == [["q", "orth", "same"]]